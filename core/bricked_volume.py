@@ -0,0 +1,235 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# --- ブリック分割ボリューム (メモリに載らない大きさのシリーズ用) ---
+# ボリュームを一辺 BRICK ボクセルの立方体 (ブリック) に分け、ブリックごとに連続した並びで .npy に保存する。
+# サンプリングで実際に触れたブリックだけを、メモリ上限付きの LRU キャッシュ (ブリックプール) に読み込む。
+# 斜めの断面やスラブでも、読むのはそれが通るブリックだけ。
+# 隣のブリックと1ボクセル重ねて持つので (受け持ちは BRICK-1)、線形補間の8点は常に1つのブリックから取れる。
+# ファイルは memmap ではなく位置指定の読み込みでプールへ直接読む (触れたページがプロセスのメモリに残らない)。
+
+class BrickedVolume:
+    """
+    MPR のボリュームとして ndarray の代わりに使える読み取り専用のボリューム
+    (shape / dtype、整数・連続スライスでの取り出し、map_coordinates 相当のサンプリング)
+    :param path: BrickWriter で書いた .npy (shape = (gz, gy, gx, BRICK, BRICK, BRICK))
+    :param shape: ボリュームの (Z, Y, X)
+    :param cache_bytes: ブリックプールの上限 / None なら ZETA_BRICK_CACHE_MB
+    """
+    BRICK = 32                  # 保存する一辺のボクセル数 (int16 で 64KB)
+    # 環境変数 ZETA_BRICK_CACHE_MB で上書き可能
+    DEFAULT_CACHE_MB = 1024
+    GATHER_POINTS = 1 << 18     # 一度に補間するサンプル点数 (一時配列の大きさを抑える)
+    ndim = 3
+
+    def __init__(self, path, shape, dtype, cache_bytes=None):
+        self.path = path
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self._file = open(path, 'rb')
+        np.lib.format.read_magic(self._file)   # BrickWriter は 1.0 形式で書く
+        file_shape, fortran, file_dtype = np.lib.format.read_array_header_1_0(self._file)
+        self._data_offset = self._file.tell()
+        S = int(file_shape[-1]); self.step = S - 1
+        self.grid = tuple(-(-n // self.step) for n in self.shape)
+        if tuple(file_shape) != self.grid + (S, S, S) or fortran or file_dtype != self.dtype:
+            self._file.close()
+            raise ValueError("brick file does not match the volume shape")
+        if cache_bytes is None:
+            try: cache_mb = float(os.environ.get('ZETA_BRICK_CACHE_MB', self.DEFAULT_CACHE_MB))
+            except ValueError: cache_mb = self.DEFAULT_CACHE_MB
+            cache_bytes = int(cache_mb * 1024 * 1024)
+        self._brick_bytes = S ** 3 * self.dtype.itemsize
+        self.capacity = int(min(max(8, cache_bytes // self._brick_bytes), np.prod(self.grid)))
+        # np.empty なので、実際にブリックを置いたページの分だけメモリを使う
+        self._pool = np.empty((self.capacity, S, S, S), dtype=self.dtype)
+        self._flat_pool = self._pool.reshape(-1)
+        self._slot = np.full(int(np.prod(self.grid)), -1, dtype=np.intp)   # ブリック番号 (平坦化) -> プールの位置
+        self._lru = OrderedDict()                                           # ブリック番号 -> プールの位置 (先頭が最古)
+        self._evictions = 0
+        self._lock = threading.Lock()
+        self._last = (np.array(self.shape, dtype=np.intp) - 1).reshape(3, 1)
+        # 線形補間の8点の、ブリック内の平坦化位置のずれ (Z, Y, X の順に 0/1)
+        self._corner_offsets = [dz * S * S + dy * S + dx for dz in (0, 1) for dy in (0, 1) for dx in (0, 1)]
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    @property
+    def cached_bytes(self):
+        """ブリックプールに読み込み済みの量"""
+        with self._lock: return len(self._lru) * self._brick_bytes
+
+    def _fetch(self, flat_ids):
+        """ブリックをプールに読み込む (ロック中に呼ぶ)。プールに全部は入らなければ False"""
+        if len(flat_ids) > self.capacity: return False
+        lru = self._lru
+        missing = []
+        for b in flat_ids:
+            b = int(b)
+            if b in lru: lru.move_to_end(b)
+            else: missing.append(b)
+        # 今回使うブリックは末尾に寄せてあるので、先頭から追い出しても今回の分は消えない
+        for b in sorted(missing):
+            if len(lru) < self.capacity: slot = len(lru)
+            else:
+                old, slot = lru.popitem(last=False)
+                self._slot[old] = -1; self._evictions += 1
+            self._file.seek(self._data_offset + b * self._brick_bytes)
+            if self._file.readinto(memoryview(self._pool[slot]).cast('B')) != self._brick_bytes:
+                raise IOError(f"brick file is truncated: {self.path}")
+            self._slot[b] = slot; lru[b] = slot
+        return True
+
+    # --- 部分ブロックの取り出し ---
+    def __getitem__(self, key):
+        """整数・連続スライスでの取り出し。ブリックから組み立てた ndarray (コピー) を返す"""
+        if not isinstance(key, tuple): key = (key,)
+        if len(key) > 3: raise IndexError("too many indices for BrickedVolume")
+        key = key + (slice(None),) * (3 - len(key))
+        ranges = []; squeeze = []
+        for axis, k in enumerate(key):
+            n = self.shape[axis]
+            if isinstance(k, slice):
+                start, stop, step = k.indices(n)
+                if step != 1: raise IndexError("BrickedVolume supports only contiguous slices")
+                ranges.append((start, max(start, stop)))
+            else:
+                i = int(k)
+                if i < 0: i += n
+                if not 0 <= i < n: raise IndexError(f"index {k} is out of bounds for axis {axis} with size {n}")
+                ranges.append((i, i + 1)); squeeze.append(axis)
+        out = np.empty(tuple(b - a for a, b in ranges), dtype=self.dtype)
+        if out.size: self._read_block(ranges, out)
+        if squeeze: out = out.reshape([s for axis, s in enumerate(out.shape) if axis not in squeeze])
+        return out
+
+    def _read_block(self, ranges, out):
+        b = self.step
+        per_axis = [np.arange(lo // b, (hi - 1) // b + 1) for lo, hi in ranges]
+        bricks = np.stack(np.meshgrid(*per_axis, indexing='ij'), axis=-1).reshape(-1, 3)
+        # プールに入る数ずつ読み込んで書き写す (重ねた1ボクセルは使わない)
+        for g0 in range(0, len(bricks), self.capacity):
+            group = bricks[g0:g0 + self.capacity]
+            flat_ids = np.ravel_multi_index(group.T, self.grid)
+            with self._lock:
+                self._fetch(flat_ids)
+                for brick, flat_id in zip(group, flat_ids):
+                    src = []; dst = []
+                    for axis in range(3):
+                        base = int(brick[axis]) * b
+                        lo = max(ranges[axis][0], base); hi = min(ranges[axis][1], base + b)
+                        src.append(slice(lo - base, hi - base)); dst.append(slice(lo - ranges[axis][0], hi - ranges[axis][0]))
+                    out[tuple(dst)] = self._pool[self._slot[flat_id]][tuple(src)]
+
+    # --- サンプリング ---
+    def map_coordinates(self, coords, order=1, cval=0.0):
+        """
+        scipy.ndimage.map_coordinates(volume, coords, order, mode='constant', cval=cval) 相当
+        (order は 0 / 1。範囲 [0, n-1] の外は cval)
+        :param coords: (3, ...) のボクセル座標 (Z, Y, X)
+        :return: coords.shape[1:] の float32
+        """
+        if order > 1: raise ValueError("BrickedVolume supports only order 0 and 1")
+        coords = np.asarray(coords)
+        out = np.full(coords.shape[1:], cval, dtype=np.float32)
+        flat_c = coords.reshape(3, -1); flat_out = out.reshape(-1)
+        for p0 in range(0, flat_out.size, self.GATHER_POINTS):
+            c = flat_c[:, p0:p0 + self.GATHER_POINTS]
+            inside = np.flatnonzero(np.all((c >= 0) & (c <= self._last), axis=0))
+            if len(inside): flat_out[p0 + inside] = self._interpolate(c[:, inside], order)
+        return out
+
+    def _interpolate(self, c, order):
+        b = self.step; S = b + 1; gz, gy, gx = self.grid
+        # 補間の基準点 (線形補間は切り捨て、最近傍は map_coordinates と同じく 0.5 を切り上げ)
+        base = np.floor(c) if order else np.floor(c + 0.5)
+        i = base.astype(np.intp)
+        brick = i // b; local = i - brick * b
+        flat_ids = (brick[0] * gy + brick[1]) * gx + brick[2]
+        within = (local[0] * S + local[1]) * S + local[2]
+
+        # 触れるブリックだけを読み込む (プールに入りきらない数なら点を半分に分けて処理する)
+        mark = np.zeros(len(self._slot), dtype=bool); mark[flat_ids] = True
+        touched = np.flatnonzero(mark)
+        if len(touched) > self.capacity:
+            half = c.shape[1] // 2
+            return np.concatenate([self._interpolate(c[:, :half], order), self._interpolate(c[:, half:], order)])
+
+        def gather():
+            start = self._slot[flat_ids] * (S ** 3) + within
+            return [self._flat_pool.take(start + d) for d in (self._corner_offsets if order else (0,))]
+
+        with self._lock:
+            self._fetch(touched); evictions = self._evictions
+        # 取り出しはロックの外で行い、その間に他のスレッドがブリックを追い出していたらロック中にやり直す
+        values = gather()
+        if self._evictions != evictions:
+            with self._lock:
+                self._fetch(touched); values = gather()
+
+        if not order: return values[0]
+        # X, Y, Z の順に線形補間する (範囲の端では重みが 0 になる側に重ねたボクセルが来る)
+        t = (c - base).astype(np.float32)
+        v = [x.astype(np.float32) for x in values]
+        v = [v[k] + t[2] * (v[k + 1] - v[k]) for k in (0, 2, 4, 6)]
+        v = [v[k] + t[1] * (v[k + 1] - v[k]) for k in (0, 2)]
+        return v[0] + t[0] * (v[1] - v[0])
+
+class BrickWriter:
+    """
+    ボリュームを先頭 (Z=0) から順に受け取り、ブリック分割の .npy を書く
+    (メモリに持つのはZ方向1ブリック分のスライスだけ。通常の書き込みなので書いた分はメモリに残らない)
+    """
+    def __init__(self, path, shape, dtype, brick=BrickedVolume.BRICK):
+        self.path = path
+        self.shape = tuple(int(n) for n in shape)
+        self.dtype = np.dtype(dtype)
+        self.brick = S = int(brick); b = self.step = S - 1
+        self.grid = gz, gy, gx = tuple(-(-n // b) for n in self.shape)
+        # 1段分のスライス (次の段と1枚重なる)。範囲外は 0 で埋める
+        self._buf = np.zeros((S, gy * b + 1, gx * b + 1), dtype=self.dtype)
+        self._filled = 0
+        self._row = 0
+        self._file = open(path, 'wb')
+        np.lib.format.write_array_header_1_0(self._file, {
+            'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False, 'shape': self.grid + (S, S, S)})
+
+    def write(self, slices):
+        """続きのスライス (k, Y, X) を書く"""
+        b = self.step; ny, nx = self.shape[1:]
+        for s in slices:
+            if self._filled >= self.shape[0]: raise ValueError("too many slices for BrickWriter")
+            k = self._filled - self._row * b
+            self._buf[k, :ny, :nx] = s
+            self._filled += 1
+            if k == b:
+                self._flush_row()
+                # 段の最後のスライスは次の段の先頭でもある
+                self._buf[0] = self._buf[b]; self._row += 1
+
+    def _flush_row(self):
+        S = self.brick; b = self.step
+        # (S, Y', X') から重なりのある (S, S) の窓を b ごとに取り、(gy, gx, S, S, S) のブリック順に並べる
+        windows = np.lib.stride_tricks.sliding_window_view(self._buf, (S, S), axis=(1, 2))[:, ::b, ::b]
+        np.ascontiguousarray(windows.transpose(1, 2, 0, 3, 4)).tofile(self._file)
+
+    def close(self):
+        """最後の段を書いて閉じる (全スライスを書き終えている必要がある。2回目以降は何もしない)"""
+        if self._buf is None: return
+        if self._filled != self.shape[0]: raise ValueError(f"BrickWriter got {self._filled} of {self.shape[0]} slices")
+        k = self._filled - self._row * self.step
+        self._buf[k:] = 0; self._flush_row()
+        self._file.close(); self._buf = None
+
+    def abort(self):
+        self._file.close(); self._buf = None
+        try: os.remove(self.path)
+        except OSError: pass
@@ -0,0 +1,21 @@
+import os
+import sys
+
+def get_cache_dir(*subdirs):
+    """
+    ユーザーごとのキャッシュディレクトリを返す (無ければ作成)
+    環境変数 ZETA_CACHE_DIR で場所を上書きできる
+    """
+    base = os.environ.get('ZETA_CACHE_DIR')
+    if not base:
+        if sys.platform == 'win32':
+            root = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+            base = os.path.join(root, 'ZETA', 'Cache')
+        elif sys.platform == 'darwin':
+            base = os.path.join(os.path.expanduser('~'), 'Library', 'Caches', 'ZETA')
+        else:
+            root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+            base = os.path.join(root, 'zeta')
+    path = os.path.join(base, *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,57 @@
+import pydicom
+
+# --- シリーズ分類用ヘッダ読み込み ---
+# プロセスプールのワーカーから呼ばれるため、Qt等の重いモジュールには依存させない
+
+SERIES_TAGS = ['SeriesInstanceUID', 'SeriesDescription', 'Modality']
+INDEX_TAGS = SERIES_TAGS + ['InstanceNumber', 'ImagePositionPatient', 'PixelSpacing', 'SliceThickness']
+
+def read_header(full_path, tags, required=None):
+    """
+    必要なタグだけを最小限のバイト数で読み込む
+    specific_tags 指定時、pydicom は不要なタグの値 (プライベートタグや
+    オーバーレイ等の大きな値) を読まずに seek で飛ばすため、読み込み量が小さい。
+    required のタグが見つからない場合のみ、従来通りのフルパースに切り替える。
+    :param tags: 読み込むタグ (キーワード)
+    :param required: 必須タグ。None の場合は tags 全て
+    :return: pydicom Dataset / DICOMでなければ例外
+    """
+    if required is None: required = tags
+    # DICOMでないファイル (InvalidDicomError) はここで例外になる。フルパースしても結果は同じなので読み直さない
+    ds = pydicom.dcmread(full_path, stop_before_pixels=True, specific_tags=tags)
+    if all(t in ds for t in required): return ds
+
+    # フォールバック: 従来通りのフルパース
+    return pydicom.dcmread(full_path, stop_before_pixels=True)
+
+def parse_floats(value, n):
+    try:
+        vals = [float(v) for v in value]
+        return tuple(vals) if len(vals) == n else None
+    except Exception:
+        return None
+
+def read_index_record(full_path):
+    """
+    1ファイルのヘッダを読み、シリーズ分類とインデックス登録に必要な情報を返す
+    :return: (path, record) / DICOMでなければ (path, None)
+             record = {'uid', 'desc', 'modality', 'instance', 'position', 'spacing', 'thickness'}
+    """
+    try:
+        ds = read_header(full_path, INDEX_TAGS, required=['SeriesInstanceUID'])
+    except Exception:
+        return full_path, None
+    try: instance = int(ds.get('InstanceNumber'))
+    except Exception: instance = None
+    try: thickness = float(ds.get('SliceThickness'))
+    except Exception: thickness = None
+    record = {
+        'uid': str(ds.get('SeriesInstanceUID', 'Unknown')),
+        'desc': str(ds.get('SeriesDescription', 'No Description')),
+        'modality': str(ds.get('Modality', '??')),
+        'instance': instance,
+        'position': parse_floats(ds.get('ImagePositionPatient', []), 3),
+        'spacing': parse_floats(ds.get('PixelSpacing', []), 2),
+        'thickness': thickness,
+    }
+    return full_path, record
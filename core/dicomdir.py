@@ -0,0 +1,45 @@
+import pydicom
+from pydicom.fileset import FileSet
+from core.dicom_header import read_header, parse_floats
+
+# --- DICOMDIR 高速パス ---
+# CD/PACSエクスポートに含まれる DICOMDIR のディレクトリレコードから、
+# 各インスタンスを開かずにシリーズ表を組み立てる
+
+def read_dicomdir(dicomdir_path):
+    """
+    DICOMDIR を読み、参照されている画像ファイルの分類情報を返す
+    :return: {path: record}  (record は read_index_record と同じ形式)
+    """
+    fs = FileSet(pydicom.dcmread(dicomdir_path))
+    records = {}
+    for inst in fs:
+        uid = getattr(inst, 'SeriesInstanceUID', None)
+        if uid is None: continue
+        try: instance = int(getattr(inst, 'InstanceNumber', None))
+        except Exception: instance = None
+        records[inst.path] = {
+            'uid': str(uid),
+            'desc': getattr(inst, 'SeriesDescription', None),
+            'modality': str(getattr(inst, 'Modality', '??')),
+            'instance': instance,
+            'position': parse_floats(getattr(inst, 'ImagePositionPatient', []), 3),
+            'spacing': parse_floats(getattr(inst, 'PixelSpacing', []), 2),
+            'thickness': None,
+        }
+
+    # SeriesDescription は SERIES レコードでは任意項目なので、
+    # 無い場合はシリーズごとに1ファイルだけヘッダを読んで補う
+    descs = {}
+    for path, record in records.items():
+        uid = record['uid']
+        if record['desc'] is not None: descs.setdefault(uid, str(record['desc'])); continue
+        if uid in descs: continue
+        try:
+            ds = read_header(path, ['SeriesDescription'], required=[])
+            descs[uid] = str(ds.get('SeriesDescription', 'No Description'))
+        except Exception:
+            descs[uid] = 'No Description'
+    for record in records.values():
+        record['desc'] = descs.get(record['uid'], 'No Description')
+    return records
@@ -0,0 +1,53 @@
+import os
+import threading
+from collections import OrderedDict
+
+# --- 2D表示のフレームキャッシュ ---
+# ウィンドウ処理済みの 8bit 画像を (シリーズ, スライス番号, WL, WW) で保持する。
+# 一度表示したスライスや先読みしたスライスは、CT値への変換もウィンドウ処理もせずに表示できる。
+
+class FrameCache:
+    """
+    1ビューポート分のフレームキャッシュ (LRU)。先読みの描画スレッドとGUIスレッドの両方から呼ばれるのでロックする
+    """
+    # 環境変数 ZETA_FRAME_CACHE_MB で上書き可能
+    DEFAULT_LIMIT_MB = 128
+
+    def __init__(self, limit_bytes=None):
+        if limit_bytes is None:
+            try: limit_mb = float(os.environ.get('ZETA_FRAME_CACHE_MB', self.DEFAULT_LIMIT_MB))
+            except ValueError: limit_mb = self.DEFAULT_LIMIT_MB
+            limit_bytes = int(limit_mb * 1024 * 1024)
+        self.limit_bytes = limit_bytes
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()   # key -> (H, W) uint8 (LRU順, 末尾が最新)
+        self._bytes = 0
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear(); self._bytes = 0
+
+    def __contains__(self, key):
+        with self._lock: return key in self._frames
+
+    @property
+    def used_bytes(self):
+        return self._bytes
+
+    def get(self, key):
+        """:return: 8bit 画像 (読み取り専用) / 無ければ None"""
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None: self._frames.move_to_end(key)
+            return frame
+
+    def put(self, key, frame):
+        if frame.nbytes > self.limit_bytes: return
+        frame.flags.writeable = False
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None: self._bytes -= old.nbytes
+            self._frames[key] = frame; self._bytes += frame.nbytes
+            while self._bytes > self.limit_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self._bytes -= evicted.nbytes
@@ -1,72 +1,609 @@
 import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 import pydicom
+from pydicom import pixels
 import numpy as np
 import SimpleITK as sitk
 from PyQt6.QtCore import QThread, pyqtSignal
+from core.dicom_header import read_header, read_index_record, parse_floats
+from core.series_index import SeriesIndex
+from core.dicomdir import read_dicomdir
+from core.series import CompactSeries, extract_slice_info, extract_meta
+from core.volume_store import VolumeStore
+from core.volume import VolumeStats, VolumeGrid, crop_to_body
+from core.bricked_volume import BrickedVolume
+
+def _scan_directory(path):
+    """1ディレクトリ分の (ファイル -> (size, mtime_ns)) とサブディレクトリ一覧"""
+    files = {}; subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    # シンボリックリンクのディレクトリは循環を避けるため辿らない
+                    if entry.is_dir(follow_symlinks=False): subdirs.append(entry.path)
+                    elif entry.is_file():
+                        st = entry.stat()
+                        files[entry.path] = (st.st_size, st.st_mtime_ns)
+                except OSError: continue
+    except OSError as e:
+        print(f"Cannot scan {path}: {e}")
+    return files, subdirs
 
 class DicomScanWorker(QThread):
     finished = pyqtSignal(dict, str)
     error = pyqtSignal(str)
+    # スキャン途中の差分 {uid: {'desc', 'modality', 'files': [追加分]}}
+    partial = pyqtSignal(dict)
+
+    # これ未満のファイル数ならプール起動コストの方が高いので逐次読み込み
+    PARALLEL_MIN_FILES = 64
+    # 途中経過の通知間隔 (秒)。GUIスレッドを埋めないよう、この間隔でまとめて送る
+    PARTIAL_INTERVAL = 0.25
+    # ディレクトリ探索はI/O待ちが主なのでスレッドで並列化
+    DISCOVERY_THREADS = 8
 
-    def __init__(self, folder_path):
+    def __init__(self, folder_path, max_workers=None, use_index=True, recursive=True):
         super().__init__()
         self.folder_path = folder_path
+        # サブフォルダも探索する (CD/PACSエクスポートは階層が深い)
+        self.recursive = recursive
+        # None の場合は全コアを使用 / 1 で従来通りの逐次スキャン
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # 永続インデックス (再オープン時は stat だけで済ませる)
+        self.use_index = use_index
+        self._pending = {}
+        self._last_emit = 0.0
 
     def run(self):
         try:
-            files = os.listdir(self.folder_path)
-            temp_series_info = {}
+            folder = os.path.abspath(self.folder_path)
+            stats, walked = self._discover(folder)
+            dicomdirs = sorted(p for p in stats if os.path.basename(p).upper() == 'DICOMDIR')
+            files = sorted(p for p in stats if p not in dicomdirs)
+
+            # DICOMDIR があれば、参照されているファイルは開かずに分類する
+            records = {}
+            lower_map = {p.lower(): p for p in files}
+            for dicomdir in dicomdirs:
+                try: dir_records = read_dicomdir(dicomdir)
+                except Exception as e:
+                    print(f"DICOMDIR read failed ({dicomdir}): {e}"); continue
+                for path, record in dir_records.items():
+                    # CD由来のファイル名は大文字小文字が一致しないことがある
+                    actual = path if path in stats else lower_map.get(path.lower())
+                    if actual is not None and actual not in records:
+                        records[actual] = record; self._queue_partial(actual, record)
+
+            index = self._open_index()
+            cached = {}
+            if index is not None:
+                try: cached = index.lookup_folder(folder)
+                except Exception as e: print(f"Series index lookup failed: {e}")
+
+            # サイズと更新日時が一致するものはインデックスの結果をそのまま使う
+            # (DICOMDIR に無いファイルだけが対象)
+            to_parse = []
             for f in files:
-                full_path = os.path.join(self.folder_path, f)
-                if os.path.isdir(full_path): continue
+                if f in records: continue
+                hit = cached.get(f)
+                if hit is not None and hit[:2] == stats[f]:
+                    records[f] = hit[2]; self._queue_partial(f, hit[2])
+                else: to_parse.append(f)
+            self._flush_partial(force=True)
+
+            for full_path, record in self._iter_headers(to_parse):
+                records[full_path] = record
+                self._queue_partial(full_path, record); self._flush_partial()
+                if self.isInterruptionRequested(): break
+            self._flush_partial(force=True)
+
+            if index is not None:
                 try:
-                    ds = pydicom.dcmread(full_path, stop_before_pixels=True)
-                    uid = ds.get('SeriesInstanceUID', 'Unknown')
-                    desc = ds.get('SeriesDescription', 'No Description')
-                    modality = ds.get('Modality', '??')
-                    if uid not in temp_series_info:
-                        temp_series_info[uid] = {'desc': desc, 'modality': modality, 'files': []}
-                    temp_series_info[uid]['files'].append(full_path)
-                except: continue
+                    parsed = [f for f in to_parse if f in records]
+                    index.store([(f,) + stats[f] + (records[f],) for f in parsed])
+                    # 今回探索したディレクトリ直下のものだけを消す
+                    # (非再帰スキャンでサブフォルダの登録を消さないため)
+                    stale = [p for p in cached if p not in stats and os.path.dirname(p) in walked]
+                    if stale: index.remove(stale)
+                except Exception as e: print(f"Series index update failed: {e}")
+                finally: index.close()
+            if self.isInterruptionRequested(): return
+
+            temp_series_info = {}
+            # パス順に処理するので、シリーズ順・ファイル順とも毎回同じになる
+            for f in files:
+                record = records.get(f)
+                if record is None: continue
+                uid = record['uid']
+                if uid not in temp_series_info:
+                    temp_series_info[uid] = {'desc': record['desc'], 'modality': record['modality'], 'files': []}
+                temp_series_info[uid]['files'].append(f)
             
             if not temp_series_info: self.error.emit("No DICOM files found.")
             else: self.finished.emit(temp_series_info, f"FOUND {len(temp_series_info)} SERIES.")
         except Exception as e: self.error.emit(str(e))
 
+    # --- ファイル探索 (サブフォルダも含めて並列に scandir) ---
+    def _discover(self, folder):
+        """:return: ({ファイル: (size, mtime_ns)}, 探索したディレクトリの集合)"""
+        if not self.recursive:
+            files, _ = _scan_directory(folder)
+            return files, {folder}
+        stats = {}; walked = {folder}
+        with ThreadPoolExecutor(max_workers=self.DISCOVERY_THREADS) as pool:
+            pending = {pool.submit(_scan_directory, folder)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    files, subdirs = fut.result()
+                    stats.update(files)
+                    for d in subdirs:
+                        walked.add(d); pending.add(pool.submit(_scan_directory, d))
+        return stats, walked
+
+    # --- 途中経過の通知 (差分をまとめて一定間隔で送る) ---
+    def _queue_partial(self, full_path, record):
+        if record is None: return
+        uid = record['uid']
+        if uid not in self._pending:
+            self._pending[uid] = {'desc': record['desc'], 'modality': record['modality'], 'files': []}
+        self._pending[uid]['files'].append(full_path)
+
+    def _flush_partial(self, force=False):
+        if not self._pending: return
+        now = time.monotonic()
+        if not force and now - self._last_emit < self.PARTIAL_INTERVAL: return
+        self.partial.emit(self._pending)
+        self._pending = {}
+        self._last_emit = now
+
+    def _open_index(self):
+        if not self.use_index: return None
+        # キャッシュが使えない環境 (読み取り専用など) でもスキャン自体は続行する
+        try: return SeriesIndex()
+        except Exception as e:
+            print(f"Series index unavailable: {e}")
+            return None
+
+    def _iter_headers(self, files):
+        workers = min(self.max_workers, len(files))
+        if workers <= 1 or len(files) < self.PARALLEL_MIN_FILES:
+            for f in files: yield read_index_record(f)
+            return
+
+        # pydicom のパースはGILに縛られるため、スレッドではなくプロセスで並列化
+        chunksize = max(1, len(files) // (workers * 8))
+        # 中断時 (ジェネレータを閉じた時) は、map が未着手のチャンクを取り消す
+        try: yield from _get_scan_pool(workers).map(read_index_record, files, chunksize=chunksize)
+        except BrokenProcessPool:
+            _reset_scan_pool(); raise
+
+# --- ヘッダ読み込み用のプロセスプール ---
+# spawn のワーカーは起動コストが大きいので、スキャンごとに作らずアプリ全体で使い回す。
+# (fork はQtのスレッドと相性が悪いので、Windowsと同じ spawn に統一。ワーカーが import するのは
+#  core.dicom_header (pydicom) だけで、main.py のGUIの import は __main__ ブロックの中にある)
+_scan_pool = None
+_scan_pool_workers = 0
+_scan_pool_lock = threading.Lock()
+
+def _get_scan_pool(workers):
+    global _scan_pool, _scan_pool_workers
+    with _scan_pool_lock:
+        if _scan_pool is not None and _scan_pool_workers != workers:
+            _scan_pool.shutdown(wait=False, cancel_futures=True); _scan_pool = None
+        if _scan_pool is None:
+            _scan_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _scan_pool_workers = workers
+        return _scan_pool
+
+def _reset_scan_pool():
+    """ワーカーが異常終了したプールは使えないので、次のスキャンで作り直す"""
+    global _scan_pool
+    with _scan_pool_lock:
+        if _scan_pool is not None: _scan_pool.shutdown(wait=False, cancel_futures=True)
+        _scan_pool = None
+
+# 並び替えと配列確保のために先に読むタグ
+LOAD_HEADER_TAGS = ['InstanceNumber', 'Rows', 'Columns', 'SamplesPerPixel',
+                    'BitsAllocated', 'PixelRepresentation', 'NumberOfFrames']
+
+def _read_load_header(f_path):
+    try:
+        ds = read_header(f_path, LOAD_HEADER_TAGS, required=['Rows'])
+        if 'Rows' in ds: return f_path, ds
+    except Exception: pass
+    return f_path, None
+
 class SeriesLoadWorker(QThread):
-    finished = pyqtSignal(list, list) 
+    # CompactSeries (読み込めるスライスが無ければ None)
+    finished = pyqtSignal(object)
     progress = pyqtSignal(int)
 
-    def __init__(self, file_paths):
+    def __init__(self, file_paths, max_workers=None):
         super().__init__()
         self.file_paths = file_paths
+        # デコーダ (numpy/pylibjpeg/GDCM等) はGILを解放するので、スレッドで並列化して
+        # 事前確保した1つの配列へ直接書き込む
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def cancel(self):
+        self.requestInterruption()
 
     def run(self):
-        loaded_slices = []
         total = len(self.file_paths)
-        for i, f_path in enumerate(self.file_paths):
-            try:
-                ds = pydicom.dcmread(f_path)
-                if hasattr(ds, 'PixelData'): loaded_slices.append(ds)
-            except: pass
-            if i % 5 == 0: self.progress.emit(int((i / total) * 100))
-        
-        loaded_slices.sort(key=lambda x: int(x.InstanceNumber) if 'InstanceNumber' in x else x.filename)
-        pixel_spacing = None
-        if loaded_slices and 'PixelSpacing' in loaded_slices[0]:
-            pixel_spacing = [float(x) for x in loaded_slices[0].PixelSpacing]
-        self.finished.emit(loaded_slices, pixel_spacing)
+        if total == 0: self.finished.emit(None); return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            # 1. ヘッダだけ読んで並び順と配列サイズを決める (0-10%)
+            headers = []
+            for i, (f_path, ds) in enumerate(pool.map(_read_load_header, self.file_paths)):
+                if self.isInterruptionRequested():
+                    pool.shutdown(wait=True, cancel_futures=True); return
+                if ds is not None: headers.append((f_path, ds))
+                if i % 20 == 0: self.progress.emit(int((i / total) * 10))
+            if not headers: self.finished.emit(None); return
+            headers.sort(key=lambda x: int(x[1].InstanceNumber) if 'InstanceNumber' in x[1] else x[0])
+
+            # 2. 1ファイルずつ読み込み→デコード→Datasetは破棄 (10-100%)
+            series = self._decode_series(pool, headers)
+            if self.isInterruptionRequested(): return
+
+        self.progress.emit(100)
+        self.finished.emit(series)
+
+    def _decode_series(self, pool, headers):
+        n = len(headers)
+        paths = [h[0] for h in headers]
+        slopes = np.ones(n); intercepts = np.zeros(n); positions = np.full((n, 3), np.nan)
+        ok = np.zeros(n, dtype=bool)
+        meta = [None]
+
+        stacked = self._is_uniform([h[1] for h in headers])
+        target = [None] * n   # スタック化できない場合の個別配列
+
+        def decode(i):
+            ds = pydicom.dcmread(paths[i])
+            arr = pixels.pixel_array(ds)
+            slopes[i], intercepts[i], positions[i] = extract_slice_info(ds)
+            if i == 0: meta[0] = extract_meta(ds)
+            return arr
+
+        # 先頭スライスで dtype を確定してから配列を確保
+        stack = None
+        try:
+            first = decode(0)
+            if stacked and first.ndim == 2:
+                stack = np.empty((n,) + first.shape, dtype=first.dtype)
+                stack[0] = first
+            else: target[0] = first
+            ok[0] = True
+        except Exception as e:
+            print(f"Decode Error: {e}")
+
+        def decode_into(i):
+            arr = decode(i)
+            if stack is not None: stack[i] = arr
+            else: target[i] = arr
+            # 形状違いなどで格納に失敗したスライスを「読めた」扱いにしない
+            ok[i] = True
+
+        futures = [pool.submit(decode_into, i) for i in range(1, n)]
+        for done, fut in enumerate(as_completed(futures)):
+            if self.isInterruptionRequested():
+                for f in futures: f.cancel()
+                return None
+            try: fut.result()
+            except Exception as e: print(f"Decode Error: {e}")
+            if done % 5 == 0: self.progress.emit(10 + int((done / n) * 90))
+
+        if not ok.any(): return None
+        if meta[0] is None:
+            # 先頭スライスが壊れていた場合は、読めた最初のスライスから作る
+            meta[0] = extract_meta(pydicom.dcmread(paths[int(np.argmax(ok))], stop_before_pixels=True))
+        if stack is not None:
+            # 読めなかったスライスは除外 (まれなのでコピーで良い)
+            if not ok.all(): stack = stack[ok]
+            pixel_data = stack
+        else:
+            pixel_data = [target[i] for i in range(n) if ok[i]]
+        keep = np.flatnonzero(ok)
+        return CompactSeries(pixel_data, [paths[i] for i in keep], slopes[keep], intercepts[keep], positions[keep], meta[0])
+
+    @staticmethod
+    def _is_uniform(headers):
+        """全スライスが同じ行列サイズ・画素形式で、1つの配列に積めるか"""
+        keys = ('Rows', 'Columns', 'SamplesPerPixel', 'BitsAllocated', 'PixelRepresentation')
+        ref = [headers[0].get(k) for k in keys]
+        for ds in headers:
+            if [ds.get(k) for k in keys] != ref: return False
+            if int(ds.get('NumberOfFrames', 1) or 1) != 1: return False
+        return True
 
 # --- ★修正: MPR構築ワーカー (Float32 & 背景色対策) ---
+IDENTITY_DIRECTION = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
+
+# MPRボリュームの格納型
+# 'int16': Rescale適用後の値が整数で int16 に収まる場合は int16 で保持する (float32 の半分)
+#          収まらない場合 (小数のSlope等) は自動的に float32
+# 環境変数 ZETA_VOLUME_DTYPE=float32 で従来通り float32 固定にできる
+VOLUME_DTYPE = os.environ.get('ZETA_VOLUME_DTYPE', 'int16')
+INT16_RANGE = (-32768, 32767)
+# 構築後に体の範囲だけを切り出して保持する (core.volume.crop_to_body)。ZETA_MPR_CROP=0 で無効
+MPR_CROP = os.environ.get('ZETA_MPR_CROP', '1') != '0'
+SITK_INTEGER_TYPES = (sitk.sitkInt8, sitk.sitkUInt8, sitk.sitkInt16, sitk.sitkUInt16, sitk.sitkInt32, sitk.sitkUInt32)
+
+# これより大きい (1つの配列としてメモリに載せるのが厳しい) ボリュームは、スライスを順に読みながら
+# ブリック分割 (core.bricked_volume) でディスクに直接組み立てる。環境変数 ZETA_BRICK_THRESHOLD_MB で上書き可能
+try: BRICK_THRESHOLD_MB = float(os.environ.get('ZETA_BRICK_THRESHOLD_MB', 4096))
+except ValueError: BRICK_THRESHOLD_MB = 4096.0
+GEOMETRY_HEADER_TAGS = ['ImagePositionPatient', 'ImageOrientationPatient', 'PixelSpacing', 'Rows', 'Columns',
+                        'RescaleSlope', 'RescaleIntercept', 'SamplesPerPixel', 'NumberOfFrames']
+
+def _read_geometry_header(f_path):
+    try: return read_header(f_path, GEOMETRY_HEADER_TAGS, required=['Rows', 'Columns'])
+    except Exception: return None
+
+def _series_fits_int16(series):
+    """Rescale 適用後の全画素が int16 で正確に表せるか"""
+    slopes = series.slopes; intercepts = series.intercepts
+    if not (np.all(slopes == np.round(slopes)) and np.all(intercepts == np.round(intercepts))): return False
+    mins = series.pixels.min(axis=(1, 2)).astype(np.float64); maxs = series.pixels.max(axis=(1, 2)).astype(np.float64)
+    lo = np.minimum(mins * slopes, maxs * slopes) + intercepts
+    hi = np.maximum(mins * slopes, maxs * slopes) + intercepts
+    return lo.min() >= INT16_RANGE[0] and hi.max() <= INT16_RANGE[1]
+
+def _is_oblique(direction):
+    return any(abs(direction[i] - IDENTITY_DIRECTION[i]) > 1e-5 for i in range(9))
+
+def _slice_geometry(positions, iop, pixel_spacing):
+    """
+    スライスの並び順と格子 (読み込み済みシリーズからの構築・ブリック分割の構築で共通)
+    :return: (order, (sp_z, sp_y, sp_x), origin, direction) / 組み立てられなければ None
+    """
+    if iop is None or len(iop) != 6 or pixel_spacing is None or len(pixel_spacing) != 2: return None
+    if len(positions) < 2 or not np.isfinite(positions).all(): return None
+
+    row = np.array(iop[:3]); col = np.array(iop[3:])
+    normal = np.cross(row, col)
+    if np.linalg.norm(normal) < 1e-6: return None
+    normal /= np.linalg.norm(normal)
+
+    # スライス法線方向の位置で並べる (Zだけで並べると矢状断・冠状断の撮影で破綻する)
+    dist = positions @ normal
+    order = np.argsort(dist, kind='stable')
+    gaps = np.diff(dist[order])
+    if np.min(gaps) < 1e-3: return None   # 同一位置のスライス (多相など) は従来経路に任せる
+    sp_z = float((dist[order[-1]] - dist[order[0]]) / (len(order) - 1))
+    sp_y, sp_x = float(pixel_spacing[0]), float(pixel_spacing[1])
+    origin = tuple(float(v) for v in positions[order[0]])
+    direction = (row[0], col[0], normal[0], row[1], col[1], normal[1], row[2], col[2], normal[2])
+    return order, (sp_z, sp_y, sp_x), origin, direction
+
+class _ImageBuffer:
+    """SimpleITK 画像のビューの配列インターフェースと、画像への参照を持つ (np.asarray で作った配列の base になる)"""
+    def __init__(self, view, image):
+        self.__array_interface__ = view.__array_interface__
+        self._view = view; self._image = image
+
+def _image_array(image):
+    """
+    SimpleITK 画像をコピーせずに (読み取り専用の) ndarray にする。
+    GetArrayViewFromImage のビューは画像を参照しないので、配列 (とそこから作ったビュー) が生きている間は
+    画像も解放されないよう、base に画像を持たせる
+    """
+    return np.asarray(_ImageBuffer(sitk.GetArrayViewFromImage(image), image))
+
+def build_volume_from_series(series):
+    """
+    読み込み済みの CompactSeries から、ディスクを読み直さずに3Dボリュームを組み立てる
+    :return: (volume (Z, Y, X), (sp_z, sp_y, sp_x), origin, stats, direction) / 組み立てられなければ None
+             stats は計算済みの VolumeStats (未計算なら None)
+             direction は斜めの撮影の方向余弦 (直交なら None)。ボリュームは撮影時の格子のまま返す
+    """
+    if not series.is_stacked or series.pixels.ndim != 3: return None
+    geometry = _slice_geometry(series.positions, series.orientation, series.pixel_spacing)
+    if geometry is None: return None
+    order, (sp_z, sp_y, sp_x), origin, direction = geometry
+
+    # 並べ替えながら Rescale を適用する (全体の中間コピーは作らない)
+    if VOLUME_DTYPE == 'int16' and _series_fits_int16(series):
+        volume = np.empty(series.pixels.shape, dtype=np.int16)
+        for k, idx in enumerate(order):
+            volume[k] = series.pixels[idx].astype(np.int32) * int(series.slopes[idx]) + int(series.intercepts[idx])
+    else:
+        volume = np.empty(series.pixels.shape, dtype=np.float32)
+        for k, idx in enumerate(order):
+            np.multiply(series.pixels[idx], float(series.slopes[idx]), out=volume[k], casting='unsafe')
+            volume[k] += float(series.intercepts[idx])
+
+    return volume, (sp_z, sp_y, sp_x), origin, None, (direction if _is_oblique(direction) else None)
+
 class MprBuilderWorker(QThread):
-    finished = pyqtSignal(np.ndarray, tuple)
+    finished = pyqtSignal(object, tuple, object, object)   # volume or None, spacing, VolumeStats, VolumeGrid
     progress = pyqtSignal(int)
 
-    def __init__(self, file_paths):
+    def __init__(self, file_paths, series=None, store_key=None):
         super().__init__()
         self.file_paths = file_paths
+        # 読み込み済みのシリーズがあれば、そこから直接組み立てる
+        self.series = series
+        # 指定時は構築済みボリュームをディスクに保存し、次回は memmap で開く
+        self.store_key = store_key
+        self._pending_save = None   # finished を送った後に保存する (store, save の引数)
 
     def run(self):
+        self._pending_save = None
+        # どこで失敗しても finished は必ず送る (ビューポートが構築待ちのまま残らないように)
+        try: built = self._build()
+        except Exception as e:
+            print(f"MPR Build Failed: {e}"); built = None
+        if built is None: built = (None, (1,1,1), None, None)
+        self.finished.emit(*built)
+        # 最初のMPR表示を待たせないよう、ディスクキャッシュへの保存はボリュームを渡した後に行う
+        # (このプロセスではメモリ上のボリュームを使い続け、次回以降は memmap で開く)
+        if self._pending_save is not None:
+            store, args = self._pending_save; self._pending_save = None
+            # 保存に失敗しても (元ファイルが移動・削除された等)、表示には影響しない
+            try: store.save(self.store_key, self.file_paths, *args)
+            except Exception as e: print(f"Volume cache write failed: {e}")
+
+    def _open_store(self):
+        """ディスクキャッシュ / 使えない (キャッシュ先に書き込めない等) 場合は None (メモリ上だけで組み立てる)"""
+        if not self.store_key: return None
+        try: return VolumeStore()
+        except Exception as e:
+            print(f"Volume cache unavailable: {e}"); return None
+
+    def _build(self):
+        """:return: (volume, spacing, stats, grid) / 組み立てられなければ None"""
+        store = self._open_store()
+        if store is not None:
+            cached = store.load(self.store_key, self.file_paths)
+            if cached is not None:
+                self.progress.emit(100)
+                return cached[0], cached[1], cached[3], cached[4]
+
+        if store is not None and self._estimated_bytes() > BRICK_THRESHOLD_MB * 1024 * 1024:
+            # メモリに載らない大きさなので、ブリック分割の書き込み・保存に失敗した場合は (例外として run で報告し)
+            # メモリ上に組み立てる従来経路には戻さない。None (この経路で扱えないシリーズ) の場合だけ従来経路へ
+            bricked = self._build_bricked(store)
+            if bricked is not None:
+                self.progress.emit(100)
+                return bricked
+
+        result = None
+        if self.series is not None:
+            try:
+                self.progress.emit(10)
+                result = build_volume_from_series(self.series)
+            except Exception as e:
+                print(f"MPR Build from slices failed, falling back: {e}")
+        if result is None: result = self._build_from_files()
+        if result is None: return None
+
+        volume, spacing, origin, stats, direction = result
+        # 体の外の空気を除いた範囲だけを保持する (元の格子での位置は VolumeGrid で持ち回る)
+        full_shape = volume.shape; offset = None
+        if MPR_CROP:
+            volume, offset = crop_to_body(volume)
+            # 統計は切り出した範囲で数え直す
+            if offset is not None: stats = None
+        # 斜めの撮影は撮影時の格子のまま保持し、断面ごとに方向余弦を畳み込んでサンプリングする
+        grid = VolumeGrid(full_shape, spacing, offset, direction) if offset is not None or direction is not None else None
+        # 最小値 (範囲外の塗りつぶし値)・ヒストグラムは構築時に1回だけ計算し、ボリュームと一緒に保存する
+        if stats is None: stats = VolumeStats.from_volume(volume)
+        self.progress.emit(95)
+        if store is not None: self._pending_save = (store, (volume, spacing, origin, stats, grid))
+        self.progress.emit(100)
+        return volume, spacing, stats, grid
+
+    def _estimated_bytes(self):
+        """組み立てるボリュームの大きさの見積もり (int16 で格納する場合)"""
+        try:
+            if self.series is not None and self.series.is_stacked: return self.series.pixels[0].size * len(self.series) * 2
+            ds = read_header(self.file_paths[0], ['Rows', 'Columns'])
+            return int(ds.Rows) * int(ds.Columns) * len(self.file_paths) * 2
+        except Exception: return 0
+
+    def _slice_source(self):
+        """
+        スライスを1枚ずつ読む関数と幾何情報 (読み込み済みのシリーズがあればそこから)
+        :return: (read(i) -> 格納値の2D配列, slopes, intercepts, positions, iop, pixel_spacing, (rows, cols)) / 無ければ None
+        """
+        series = self.series
+        if series is not None and series.is_stacked and series.pixels.ndim == 3:
+            return (lambda i: series.pixels[i], series.slopes, series.intercepts, series.positions,
+                    series.orientation, series.pixel_spacing, series.pixels.shape[1:])
+
+        paths = list(self.file_paths); n = len(paths)
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+            headers = []
+            for i, ds in enumerate(pool.map(_read_geometry_header, paths)):
+                if ds is None: return None
+                headers.append(ds)
+                if i % 20 == 0: self.progress.emit(int((i / n) * 10))
+        size = (int(headers[0].Rows), int(headers[0].Columns))
+        for ds in headers:
+            if (int(ds.Rows), int(ds.Columns)) != size: return None
+            if int(ds.get('SamplesPerPixel', 1) or 1) != 1 or int(ds.get('NumberOfFrames', 1) or 1) != 1: return None
+        info = [extract_slice_info(ds) for ds in headers]
+        slopes = np.array([x[0] for x in info]); intercepts = np.array([x[1] for x in info])
+        positions = np.array([x[2] for x in info], dtype=np.float64)
+        iop = parse_floats(headers[0].get('ImageOrientationPatient'), 6)
+        pixel_spacing = parse_floats(headers[0].get('PixelSpacing'), 2)
+        return (lambda i: pixels.pixel_array(pydicom.dcmread(paths[i])), slopes, intercepts, positions,
+                iop, pixel_spacing, size)
+
+    def _build_bricked(self, store):
+        """
+        メモリに載らない大きさのボリュームを、スライスを順に読みながらブリック分割でディスクに書く
+        (メモリに持つのはZ方向1ブリック分のスライスだけ)
+        :return: (BrickedVolume, spacing, stats, VolumeGrid or None) / この経路で組み立てられなければ None
+                 ブリックは書きながら作るので、体の範囲での切り出しはしない (斜めの撮影は方向余弦だけ持つ)
+        """
+        source = self._slice_source()
+        if source is None: return None
+        read, slopes, intercepts, positions, iop, pixel_spacing, size = source
+        geometry = _slice_geometry(positions, iop, pixel_spacing)
+        if geometry is None: return None
+        order, spacing, origin, direction = geometry
+        shape = (len(order),) + tuple(size)
+        grid = VolumeGrid(shape, spacing, direction=direction) if _is_oblique(direction) else None
+
+        integral = np.all(slopes == np.round(slopes)) and np.all(intercepts == np.round(intercepts))
+        dtypes = (np.int16, np.float32) if VOLUME_DTYPE == 'int16' and integral else (np.float32,)
+        for dtype in dtypes:
+            writer = store.create_bricked(self.store_key, self.file_paths, shape, dtype)
+            try:
+                ok, stats = self._write_bricks(writer, read, order, slopes, intercepts)
+                if not ok: writer.abort(); continue   # int16 に収まらなかったので float32 で書き直す
+                if stats is None:
+                    # float32 は値の範囲が事前に分からないので、書き終えたファイルを読んで数える
+                    writer.close()
+                    stats = VolumeStats.from_volume(BrickedVolume(writer.path, writer.shape, writer.dtype))
+            except Exception:
+                writer.abort(); raise
+            self.progress.emit(95)
+            # ディスク上のファイルがボリュームそのものなので、保存・再オープンできなければ失敗とする
+            if not store.commit_bricked(self.store_key, self.file_paths, writer, spacing, origin, stats, grid):
+                raise RuntimeError("could not save the bricked volume to the volume cache")
+            cached = store.load(self.store_key, self.file_paths)
+            if cached is None: raise RuntimeError("could not reopen the bricked volume from the volume cache")
+            return cached[0], cached[1], cached[3], cached[4]
+        return None
+
+    def _write_bricks(self, writer, read, order, slopes, intercepts):
+        """
+        Z順に Rescale を適用して書き込む。int16 なら書きながら値の度数も数える
+        :return: (ok, stats) / int16 に収まらない値があれば ok=False、float32 の stats は None
+        """
+        integer = writer.dtype == np.int16
+        counts = np.zeros(INT16_RANGE[1] - INT16_RANGE[0] + 1, dtype=np.int64) if integer else None
+        total = len(order); B = writer.brick
+        # デコードはGILを解放するので、1ブリック分ずつスレッドで並列に読む
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+            for k0 in range(0, total, B):
+                idx = order[k0:k0 + B]
+                block = np.empty((len(idx),) + writer.shape[1:], dtype=writer.dtype)
+                for j, (i, arr) in enumerate(zip(idx, pool.map(read, idx))):
+                    if integer:
+                        v = arr.astype(np.int32) * int(slopes[i]) + int(intercepts[i])
+                        if v.min() < INT16_RANGE[0] or v.max() > INT16_RANGE[1]: return False, None
+                        block[j] = v
+                        counts += np.bincount((v - INT16_RANGE[0]).ravel(), minlength=len(counts))
+                    else:
+                        np.multiply(arr, float(slopes[i]), out=block[j], casting='unsafe')
+                        block[j] += float(intercepts[i])
+                writer.write(block)
+                self.progress.emit(10 + int(80 * min(total, k0 + B) / total))
+        return True, (VolumeStats.from_counts(counts, INT16_RANGE[0]) if integer else None)
+
+    def _build_from_files(self):
+        # 従来経路: ファイルを読み直して SimpleITK で組み立てる
         try:
             self.progress.emit(5)
             
@@ -74,7 +611,7 @@ class MprBuilderWorker(QThread):
             sorted_files = []
             for i, f in enumerate(self.file_paths):
                 try:
-                    ds = pydicom.dcmread(f, stop_before_pixels=True)
+                    ds = read_header(f, ['ImagePositionPatient'])
                     if 'ImagePositionPatient' in ds:
                         z = float(ds.ImagePositionPatient[2])
                         sorted_files.append((z, f))
@@ -96,54 +633,31 @@ class MprBuilderWorker(QThread):
             
             self.progress.emit(40)
 
-            # --- ★重要変更: Float32に変換 ---
-            # これにより、リサンプリング時の計算誤差やオーバーフローを防ぐ
-            image_sitk = sitk.Cast(image_sitk, sitk.sitkFloat32)
-
             # --- 背景色の決定 ---
-            # 統計フィルタで最小値を取得 (これが「真っ黒」の値)
-            stats = sitk.StatisticsImageFilter()
-            stats.Execute(image_sitk)
-            min_val = stats.GetMinimum()
+            # ボリューム統計 (最小値が「真っ黒」の値)。型変換では値が変わらないので、そのまま最終的な統計になる
+            stats = VolumeStats.from_volume(sitk.GetArrayViewFromImage(image_sitk))
+            min_val = stats.minimum
 
-            # 3. 幾何学的補正 (Oblique -> Orthogonal)
+            # --- 格納型の決定 ---
+            # 整数で int16 に収まれば Int16 (float32 の半分)、それ以外は Float32 に変換
+            # (Float32 は補間時の計算誤差やオーバーフローを防ぐため)
+            if (VOLUME_DTYPE == 'int16' and image_sitk.GetPixelID() in SITK_INTEGER_TYPES
+                    and min_val >= INT16_RANGE[0] and stats.maximum <= INT16_RANGE[1]):
+                pixel_type = sitk.sitkInt16
+            else: pixel_type = sitk.sitkFloat32
+            if image_sitk.GetPixelID() != pixel_type: image_sitk = sitk.Cast(image_sitk, pixel_type)
+
+            # 3. 斜めの撮影は撮影時の格子のまま返す (方向余弦はMPRのサンプリング時に畳み込む)
             direction = image_sitk.GetDirection()
-            identity = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
-            
-            is_oblique = False
-            for i in range(9):
-                if abs(direction[i] - identity[i]) > 1e-5:
-                    is_oblique = True; break
-            
-            if is_oblique:
-                orig_spacing = image_sitk.GetSpacing()
-                orig_origin = image_sitk.GetOrigin()
-                orig_size = image_sitk.GetSize()
-                
-                resampler = sitk.ResampleImageFilter()
-                resampler.SetOutputDirection(identity)
-                resampler.SetOutputOrigin(orig_origin)
-                resampler.SetOutputSpacing(orig_spacing)
-                resampler.SetSize(orig_size)
-                
-                # ★重要: デフォルト値を画像の最小値にする
-                # これで、回転してできた隙間が「黒」で埋められる
-                resampler.SetDefaultPixelValue(min_val)
-                
-                # Float32なので画素値は維持される
-                resampler.SetOutputPixelType(sitk.sitkFloat32)
-                resampler.SetInterpolator(sitk.sitkLinear)
-                
-                image_sitk = resampler.Execute(image_sitk)
+            if not _is_oblique(direction): direction = None
             
             self.progress.emit(80)
 
-            volume = sitk.GetArrayFromImage(image_sitk)
+            # コピーせずにビューで受け取る (配列が画像を参照し続けるので、画像を別に持ち回らなくてよい)
+            volume = _image_array(image_sitk)
             sp_x, sp_y, sp_z = image_sitk.GetSpacing()
-            
-            self.progress.emit(100)
-            self.finished.emit(volume, (sp_z, sp_y, sp_x))
+            return volume, (sp_z, sp_y, sp_x), image_sitk.GetOrigin(), stats, direction
 
         except Exception as e:
             print(f"MPR Build Failed: {e}")
-            self.finished.emit(None, (1,1,1))
\ No newline at end of file
+            return None
\ No newline at end of file
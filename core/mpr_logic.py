@@ -1,12 +1,19 @@
+import os
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from scipy.ndimage import map_coordinates
+from scipy.ndimage import map_coordinates, spline_filter
+from core.bricked_volume import BrickedVolume
 
-def get_resampled_slice(volume, center, right_vec, down_vec, normal_vec, width, height, spacing, thickness_mm=0.0, mode='AVG'):
+def get_resampled_slice(volume, center, right_vec, down_vec, normal_vec, width, height, spacing, thickness_mm=0.0, mode='AVG',
+                        origin=None, step=(1.0, 1.0), cval=None, order=1, max_depth=None, workers=None, slab_cache=None,
+                        stats=None, pyramid=None, grid=None):
     """
     3Dボリュームから任意の断面を切り出す（MPR/MIP対応版）
     高速化のため、Pythonのループを使わずNumpyのブロードキャスト機能を使用。
     
-    :param volume: 3D画像データ (Z, Y, X)
+    :param volume: 3D画像データ (Z, Y, X) / int16 または float32 の ndarray、または BrickedVolume
     :param center: 断面の中心座標 (cx, cy, cz)
     :param right_vec: 画像の右方向ベクトル (vx, vy, vz) ※スケーリング済みであること
     :param down_vec: 画像の下方向ベクトル (vx, vy, vz) ※スケーリング済みであること
@@ -16,12 +23,44 @@ def get_resampled_slice(volume, center, right_vec, down_vec, normal_vec, width,
     :param spacing: ボクセルスペーシング (sz, sy, sx)
     :param thickness_mm: スラブ厚 (mm)
     :param mode: 'AVG', 'MIP', 'MinIP'
+    :param origin: 出力の左上画素の (right, down) 方向オフセット (ベクトル単位)
+                   None の場合は中心を基準にした従来の格子 (-width//2 ... )
+    :param step: 出力1画素あたりの (right, down) 方向の刻み (画面解像度で一部だけ切り出す場合に使う)
+    :param cval: 範囲外の値 / None ならボリュームの最小値 (stats があればそこから、無ければ全体を走査)
+    :param order: 補間次数 (0: 最近傍 (操作中の簡易描画), 1: 線形, 3: キュービック)
+    :param max_depth: スラブ厚方向のサンプル数の上限 (操作中の簡易描画用) / None なら制限なし
+    :param workers: 並列サンプリングのスレッド数 / None なら resample_threads()、1 なら分割しない
+    :param slab_cache: ページング用の SlabCache (core.slab_cache) / スラブの層を前のフレームから使い回す
+    :param stats: 構築時に計算した VolumeStats (core.volume)
+    :param pyramid: VolumePyramid (core.volume) / 出力1画素が2ボクセル以上に当たる場合は縮小段から読む
+    :param grid: VolumeGrid (core.volume) / volume がMPRの座標系の格子そのものでない (切り出し・斜めの撮影) 場合
+                 center とベクトルはMPRの座標系で渡す
     """
+
+    # 切り出し・斜めの撮影のボリュームでは、中心とベクトルを配列の添字に直す (補間は元のボクセルから1回だけ)。
+    # anchor (配列の原点の、撮影時の格子での位置) はスラブの層の格子を撮影時の格子に揃えるのに使う
+    anchor = np.zeros(3)
+    if grid is not None:
+        center, (right_vec, down_vec, normal_vec) = grid.to_array(center, (right_vec, down_vec, normal_vec))
+        anchor = grid.anchor
+
+    # 縮小表示・操作中の簡易描画は、画面上のサンプリング密度に合った縮小段を使う (座標系も段に合わせる)
+    if pyramid is not None:
+        level, center, vectors = pyramid.select(center, (right_vec, down_vec, normal_vec), step)
+        if level is not None:
+            volume = level
+            anchor = anchor * (np.linalg.norm(vectors[0]) / np.linalg.norm(right_vec))
+            right_vec, down_vec, normal_vec = vectors
+    # ブリック分割ボリュームは全体を前処理できないので、キュービックの代わりに線形補間で描く
+    if isinstance(volume, BrickedVolume): order = min(order, 1)
     
     # 1. 2D平面のグリッド座標を作成 (Height, Width)
-    xs = np.arange(-width // 2, width // 2)
-    ys = np.arange(-height // 2, height // 2)
-    grid_x, grid_y = np.meshgrid(xs, ys) # shape: (H, W)
+    if origin is None:
+        xs = np.arange(-width // 2, width // 2)
+        ys = np.arange(-height // 2, height // 2)
+    else:
+        xs = origin[0] + step[0] * np.arange(width)
+        ys = origin[1] + step[1] * np.arange(height)
     
     # 2. 厚み方向のオフセット座標を作成 (Depth)
     z_offsets = np.array([0.0])
@@ -34,52 +73,269 @@ def get_resampled_slice(volume, center, right_vec, down_vec, normal_vec, width,
         
         # 厚みを満たすのに必要なステップ数
         steps = int(thickness_mm / sp_x)
-        if steps > 0:
-            z_offsets = np.arange(-steps // 2, steps // 2 + 1)
-    
-    # 3. 3次元的なサンプリンググリッドを作成 (Broadcasting)
-    # これにより (Depth, Height, Width) の全座標を一括計算する準備をする
-    
-    # grid_x: (H, W) -> (1, H, W)
-    grid_x_3d = grid_x[np.newaxis, :, :]
-    grid_y_3d = grid_y[np.newaxis, :, :]
-    
-    # z_offsets: (D) -> (D, 1, 1)
-    z_offs_3d = z_offsets[:, np.newaxis, np.newaxis]
+        if steps > 0: z_offsets = np.arange(-steps // 2, steps // 2 + 1)
     
+    # 背景色の決定（MinIPなどで白くならないよう、ボリュームの最小値で埋める）
+    if cval is not None: bg_value = cval
+    elif stats is not None: bg_value = stats.minimum
+    else: bg_value = np.min(volume)
+    vectors = (right_vec, down_vec, normal_vec)
+    # スラブの座標は float32 で持つ (1サンプル12バイト、ボクセル内の誤差は1e-4程度で表示には影響しない)
+    # 薄いスライスは従来通り float64 (プローブ値などが変わらないように)
+    coord_dtype = np.float64 if len(z_offsets) == 1 else np.float32
+
+    if len(z_offsets) > 1:
+        if slab_cache is not None:
+            # ページング用: 層に法線方向の格子 (normal_vec の整数倍) の番号を振り、前のフレームの層を使い回す。
+            # 格子に対する中心の端数 (phase) をキーに含めるので、層を共有するのは中心が normal_vec の整数倍だけ
+            # 動いたフレーム同士だけで、各層はキャッシュ無しと同じ位置 (中心 + z_offsets) にある。
+            # キャッシュから返すのは間引かない全層の投影 (max_depth はキャッシュ無しの描画の上限)
+            n = np.asarray(normal_vec, dtype=np.float64)
+            t = float(np.dot(np.asarray(center, dtype=np.float64) + anchor, n) / np.dot(n, n))
+            base = int(np.round(t))
+            foot = np.asarray(center, dtype=np.float64) + anchor - t * n
+            key = (id(volume), volume.shape, tuple(np.round(foot, 6)), round(t - base, 6),
+                   tuple(tuple(np.round(np.asarray(v, dtype=np.float64), 9)) for v in vectors),
+                   (float(xs[0]), float(xs[-1]), len(xs)), (float(ys[0]), float(ys[-1]), len(ys)), order, float(bg_value))
+            sample = lambda ids: _resample(volume, center, vectors, xs, ys, ids - base, order, bg_value, workers, coord_dtype)
+            result = slab_cache.project(key, z_offsets + base, mode, sample, (len(ys), len(xs)))
+            if result is not None: return result
+        if max_depth is not None and len(z_offsets) > max_depth:
+            # 厚み全体を等間隔に間引く
+            pick = np.unique(np.round(np.linspace(0, len(z_offsets) - 1, max(1, max_depth))).astype(int))
+            z_offsets = z_offsets[pick]
+
+    return _resample(volume, center, vectors, xs, ys, z_offsets, order, bg_value, workers, coord_dtype, mode)
+
+def _resample(volume, center, vectors, xs, ys, z_offsets, order, bg_value, workers, coord_dtype, mode=None):
+    """
+    格子 (xs, ys, z_offsets) でサンプリングする
+    :param mode: 'AVG' / 'MIP' / 'MinIP' なら厚み方向を投影した (H, W)、None なら投影せずに (D, H, W)
+    """
+    # 回転が無い (各ベクトルがボリュームの1軸に沿っている) 場合は、補間を軸ごとに分解して高速に切り出す
+    # (十分速いので、最近傍指定でも線形補間で返す)
+    # 厚いスラブも厚み方向に分割して畳み込むので、メモリ使用量はスラブ厚に依らない
+    if order <= 1:
+        chunk = len(z_offsets) if mode is None else _depth_chunk(len(xs) * len(ys))
+        sample = lambda zs: _sample_axis_aligned(volume, center, vectors, (xs, ys, zs), bg_value)
+        first = sample(z_offsets[:chunk])
+        if first is not None:
+            if mode is None: return first
+            rest = (sample(z_offsets[d0:d0 + chunk]) for d0 in range(chunk, len(z_offsets), chunk))
+            return _fold_chunks(first, rest, len(z_offsets), mode)
+
+    # 3. サンプリング元の準備
+    # order > 1 のスプライン前処理フィルタはボリューム全体に掛かるので、サンプル位置を含む範囲だけ切り出し、
+    # タイルごとではなく1回だけ掛けておく。切り出し範囲で掛けたフィルタは全体に掛けたものと端の近くで
+    # わずかに異なる (ボリューム全体を使う map_coordinates の近似。誤差は下の余白で値の範囲の 3e-5 程度以下)
+    source = volume; shift = None
+    out_shape = (len(ys), len(xs)) if mode is not None else (len(z_offsets), len(ys), len(xs))
+    if order > 1:
+        # 切り出し端の影響は1ボクセルごとに約0.27倍で減衰するため、8ボクセルの余白を取る
+        lo, hi = _sample_bounds(volume.shape, center, vectors, (xs, ys, z_offsets), margin=8)
+        if any(h <= l for l, h in zip(lo, hi)):
+            return np.full(out_shape, bg_value, dtype=np.float32)
+        sub = volume[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+        source = spline_filter(sub, order=order, output=np.float64, mode='constant'); shift = lo
+
+    # 4. 出力を横帯 (タイル) に分けてスレッドプールで並列にサンプリングする
+    # (map_coordinates は GIL を解放する)。各タイル内ではスラブを厚み方向に分割し、計算した分から順に投影する
+    args = (source, shift, center, vectors, xs, z_offsets, order, bg_value, coord_dtype, mode)
+    bands = _split_rows(len(ys), len(xs) * len(z_offsets), workers)
+    if len(bands) == 1: return _render_band(ys, *args)
+    out = np.empty(out_shape, dtype=np.float32)
+    pool = _get_pool()
+    futures = [(y0, y1, pool.submit(_render_band, ys[y0:y1], *args)) for y0, y1 in bands]
+    for y0, y1, f in futures: out[..., y0:y1, :] = f.result()
+    return out
+
+# --- タイル分割 ---
+RESAMPLE_MIN_ROWS = 16           # これより細い横帯には分けない
+RESAMPLE_MIN_SAMPLES = 1 << 16   # これより小さい出力 (H*W*D) は分割しない
+RESAMPLE_CHUNK_SAMPLES = 1 << 20 # 厚み方向に分割した1チャンクのサンプル数 (H*W*d)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def resample_threads():
+    """並列サンプリングのスレッド数 (環境変数 ZETA_RESAMPLE_THREADS で上書き可能)"""
+    try: n = int(os.environ.get('ZETA_RESAMPLE_THREADS', 0))
+    except ValueError: n = 0
+    return n if n > 0 else (os.cpu_count() or 1)
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None: _pool = ThreadPoolExecutor(max_workers=resample_threads(), thread_name_prefix='zeta-resample')
+        return _pool
+
+def _split_rows(height, samples_per_row, workers):
+    """出力の行を横帯 [(y0, y1), ...] に分ける (1スレッドに1本)"""
+    if workers is None: workers = resample_threads()
+    if workers <= 1 or height * samples_per_row < RESAMPLE_MIN_SAMPLES: return [(0, height)]
+    n = max(1, min(workers, height // RESAMPLE_MIN_ROWS))
+    edges = np.linspace(0, height, n + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+def _sample_bounds(shape, center, vectors, offsets, margin):
+    """サンプル位置を含むボクセル範囲 (lo, hi)。座標は格子に対して線形なので、端の8点だけを見ればよい"""
+    cx, cy, cz = center
+    corners = [np.array([t[0], t[-1]], dtype=np.float64) for t in offsets]
+    lo = []; hi = []
+    for axis, (c, k) in enumerate(((cz, 2), (cy, 1), (cx, 0))):
+        r, d, n = (v[k] for v in vectors)
+        vals = c + (corners[0][:, None, None] * r) + (corners[1][None, :, None] * d) + corners[2][None, None, :] * n
+        lo.append(max(0, int(np.floor(vals.min())) - margin))
+        hi.append(min(shape[axis], int(np.ceil(vals.max())) + margin + 1))
+    return lo, hi
+
+def _render_band(ys, source, shift, center, vectors, xs, z_offsets, order, bg_value, coord_dtype, mode):
+    """出力の横帯1本分を計算する。mode があれば投影まで行い (len(ys), W)、None なら (D, len(ys), W)"""
+    grid_x, grid_y = np.meshgrid(xs, ys) # shape: (H, W)
+
     # 中心座標とベクトル成分の展開
     cx, cy, cz = center
-    rx, ry, rz = right_vec
-    dx, dy, dz = down_vec
-    nx, ny, nz = normal_vec
-    
-    # 4. 座標計算 (Center + Right + Down + Normal)
-    # 結果は (Depth, Height, Width) の形状を持つ3D座標配列になる
-    sample_x = cx + (grid_x_3d * rx) + (grid_y_3d * dx) + (z_offs_3d * nx)
-    sample_y = cy + (grid_x_3d * ry) + (grid_y_3d * dy) + (z_offs_3d * ny)
-    sample_z = cz + (grid_x_3d * rz) + (grid_y_3d * dz) + (z_offs_3d * nz)
-    
-    # 5. マッピング実行
-    # map_coordinates は (coords, ...) を受け取る。coordsのshapeは (3, D, H, W)
-    # volumeの並びは (Z, Y, X) なので、その順序で渡す
-    coords = np.array([sample_z, sample_y, sample_x])
-    
-    # 背景色の決定（MinIPなどで白くならないよう、ボリュームの最小値で埋める）
-    bg_value = np.min(volume)
-    
-    # 補間実行
-    # mode='constant', cval=bg_value により、範囲外を黒（または最小値）で埋める
-    slab_data = map_coordinates(volume, coords, order=1, mode='constant', cval=bg_value)
-    
-    # 6. 投影処理 (Depth方向 = axis 0 を潰す)
+    (rx, ry, rz), (dx, dy, dz), (nx, ny, nz) = vectors
+
+    # 平面内の座標は1回だけ計算し、厚み方向は足し込むだけにする
+    # volumeの並びは (Z, Y, X) なので、その順序で詰める
+    planes = []
+    for c, r, d in ((cz, rz, dz), (cy, ry, dy), (cx, rx, dx)):
+        planes.append(c + (grid_x[np.newaxis, :, :] * r) + (grid_y[np.newaxis, :, :] * d))
+    normals = (nz, ny, nx)
+    if coord_dtype != np.float64 and shift is not None:
+        planes = [p - s for p, s in zip(planes, shift)]; shift = None
+
+    def sample(zs):
+        # 座標計算 (Center + Right + Down + Normal) -> (3, d, H, W)
+        z_offs_3d = zs[:, np.newaxis, np.newaxis]
+        coords = np.empty((3, len(zs)) + grid_x.shape, dtype=coord_dtype)
+        for k in range(3):
+            np.add(planes[k], z_offs_3d * normals[k], out=coords[k])
+            if shift is not None: coords[k] -= shift[k]
+        # mode='constant', cval=bg_value により、範囲外を黒（または最小値）で埋める
+        # ボリュームが int16 でも補間結果は float32 で受け取る (丸めない)
+        if isinstance(source, BrickedVolume): return source.map_coordinates(coords, order=order, cval=float(bg_value))
+        return map_coordinates(source, coords, order=order, mode='constant', cval=float(bg_value),
+                               output=np.float32, prefilter=False)
+
+    if mode is None: return sample(z_offsets)
+    depth = len(z_offsets)
+    chunk = _depth_chunk(grid_x.size)
+    rest = (sample(z_offsets[d0:d0 + chunk]) for d0 in range(chunk, depth, chunk))
+    return _fold_chunks(sample(z_offsets[:chunk]), rest, depth, mode)
+
+def _depth_chunk(plane_samples):
+    return max(1, RESAMPLE_CHUNK_SAMPLES // max(1, plane_samples))
+
+def _fold_chunks(first, rest, depth, mode):
+    """
+    厚み方向のチャンク (d, H, W) を順に投影結果へ畳み込む (スラブ全体を持たない)
+    :param first: 最初のチャンク / rest: 残りのチャンクを順に返すイテレータ
+    """
+    if depth == 1: return first[0]
+    acc = _accumulate(None, first, mode)
+    for slab_data in rest: acc = _accumulate(acc, slab_data, mode)
+    if mode in ('MIP', 'MinIP'): return acc
+    # np.mean と同じく、1枚ずつ足した和を枚数で割る (丸め誤差まで一致させる)
+    return np.true_divide(acc, np.intp(depth), out=acc, casting='unsafe')
+
+def _accumulate(acc, slab_data, mode):
+    """厚み方向の部分スラブを、それまでの投影結果に畳み込む"""
     if mode == 'MIP':
-        result = np.max(slab_data, axis=0)
-    elif mode == 'MinIP':
-        result = np.min(slab_data, axis=0)
-    else: # AVG
-        result = np.mean(slab_data, axis=0)
-        
-    return result.astype(np.float32)
+        part = np.max(slab_data, axis=0)
+        return part if acc is None else np.maximum(acc, part, out=acc)
+    if mode == 'MinIP':
+        part = np.min(slab_data, axis=0)
+        return part if acc is None else np.minimum(acc, part, out=acc)
+    for layer in slab_data:
+        if acc is None: acc = layer.copy()
+        else: np.add(acc, layer, out=acc)
+    return acc
+
+def _take(arr, idx, axis):
+    # 連続したインデックスならコピーせずにスライス (ビュー) で取り出す
+    if len(idx) > 1 and np.all(np.diff(idx) == idx[1] - idx[0]) and abs(int(idx[1] - idx[0])) == 1:
+        step = int(idx[1] - idx[0]); stop = int(idx[-1]) + step
+        sl = slice(int(idx[0]), stop if stop >= 0 else None, step)
+        return arr[(slice(None),) * axis + (sl,)]
+    return np.take(arr, idx, axis=axis)
+
+def _sample_axis_aligned(volume, center, vectors, offsets, bg_value):
+    """
+    right/down/normal がそれぞれボリュームの1軸だけに沿っている場合の切り出し
+    線形補間を軸ごとに分解し、必要な部分ブロックだけを読む。
+    map_coordinates(order=1, mode='constant') と同じ結果 (範囲 [0, n-1] の外は bg_value) を返す。
+    :param vectors: (right, down, normal) 各 (vx, vy, vz)
+    :param offsets: 出力の (W方向, H方向, D方向) の格子オフセット
+    :return: (D, H, W) の float32 / 軸に沿っていなければ None
+    """
+    # 出力軸 (D, H, W) -> ボリューム軸 (0=Z, 1=Y, 2=X) と刻み
+    axes = []; steps = []
+    for vec in (vectors[2], vectors[1], vectors[0]):
+        nz = [k for k in range(3) if vec[k] != 0]
+        if len(nz) != 1: return None
+        axes.append(2 - nz[0]); steps.append(float(vec[nz[0]]))
+    if len(set(axes)) != 3: return None
+
+    # 各出力軸のサンプル位置 (ボリューム座標)。元の経路と同じ式で計算する
+    c = (center[2], center[1], center[0])    # (Z, Y, X) 順
+    ts = (offsets[2], offsets[1], offsets[0])
+    out_shape = tuple(len(t) for t in ts)
+    out = np.full(out_shape, bg_value, dtype=np.float32)
+
+    plans = []
+    for dim in range(3):
+        n = volume.shape[axes[dim]]
+        q = c[axes[dim]] + ts[dim] * steps[dim]
+        valid = np.flatnonzero((q >= 0) & (q <= n - 1))
+        if len(valid) == 0: return out
+        q = q[valid]
+        i0 = np.floor(q).astype(np.intp)
+        t = q - i0
+        i1 = np.minimum(i0 + 1, n - 1)
+        plans.append((valid, i0, i1, t))
+
+    # 必要な範囲だけの部分ブロックを (D, H, W) の並びで取り出す (ビュー)
+    block = volume
+    sub = []
+    for dim in range(3):
+        _, i0, i1, _ = plans[dim]
+        lo = int(min(i0.min(), i1.min())); hi = int(max(i0.max(), i1.max())) + 1
+        sub.append((lo, hi))
+    sl = [slice(None)] * 3
+    for dim in range(3): sl[axes[dim]] = slice(*sub[dim])
+    block = volume[tuple(sl)].transpose(axes)
+
+    # 整数位置の軸は取り出すだけ (補間不要)
+    res = block
+    frac_dims = []
+    for dim in range(3):
+        _, i0, _, t = plans[dim]
+        if np.any(t): frac_dims.append(dim)
+        else: res = _take(res, i0 - sub[dim][0], dim)
+
+    if frac_dims:
+        # 小数位置の軸は map_coordinates と同じ順序 (角ごとに Z,Y,X の順で重みを掛けて加算) で
+        # 計算し、丸め誤差まで一致させる
+        frac_dims.sort(key=lambda d: axes[d])
+        weights = {}
+        for dim in frac_dims:
+            t = plans[dim][3]; shape = [1, 1, 1]; shape[dim] = len(t)
+            weights[dim] = ((1.0 - t).reshape(shape), t.reshape(shape))
+        acc = None
+        for corner in itertools.product((0, 1), repeat=len(frac_dims)):
+            term = res
+            for dim, k in zip(frac_dims, corner):
+                _, i0, i1, _ = plans[dim]
+                term = _take(term, (i1 if k else i0) - sub[dim][0], dim)
+            for dim, k in zip(frac_dims, corner): term = term * weights[dim][k]
+            acc = term if acc is None else acc + term
+        res = acc
+
+    d_idx, h_idx, w_idx = (p[0] for p in plans)
+    out[d_idx[0]:d_idx[-1] + 1, h_idx[0]:h_idx[-1] + 1, w_idx[0]:w_idx[-1] + 1] = res
+    return out
 
 def get_rotation_matrix(axis, angle_deg):
     """
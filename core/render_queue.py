@@ -0,0 +1,78 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QObject, pyqtSignal
+
+# --- ビューポートごとの非同期描画 ---
+# 描画 (リサンプリング・ウィンドウ処理) は全ビューポート共通のスレッドプールで行い、GUIスレッドを止めない。
+# 各ビューポートが持つのは「実行中1件 + 保留1件」だけで、保留中に新しい要求が来たら古い方を捨てる (latest-wins)。
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 環境変数 ZETA_RENDER_THREADS で上書き可能
+            try: n = int(os.environ.get('ZETA_RENDER_THREADS', 0))
+            except ValueError: n = 0
+            if n <= 0: n = min(RenderQueue.MAX_THREADS, os.cpu_count() or 1)
+            _pool = ThreadPoolExecutor(max_workers=n, thread_name_prefix='zeta-render')
+        return _pool
+
+class RenderQueue(QObject):
+    """
+    1ビューポート分の描画要求キュー。
+    job はスレッドプール上で実行される引数なしの関数で、戻り値が frame_ready(seq, result) で返る
+    (受信側はGUIスレッド / 例外時は result=None)。
+    """
+    frame_ready = pyqtSignal(int, object)
+
+    MAX_THREADS = 4   # 共通プールのスレッド数の上限
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._pending = None      # (seq, job) 実行待ちは常に最新の1件だけ
+        self._running = False
+        self._discard_below = 0   # これより古い seq の結果は送らない (cancel 用)
+
+    def submit(self, job):
+        """描画要求を追加する。まだ実行されていない前の要求は捨てられる。:return: seq"""
+        with self._lock:
+            self._seq += 1; seq = self._seq
+            if self._running:
+                self._pending = (seq, job)
+                return seq
+            self._running = True
+        _get_pool().submit(self._run, seq, job)
+        return seq
+
+    def cancel(self):
+        """
+        保留中の要求を捨て、実行中の要求の結果も送らないようにする
+        :return: これまでに発行した最後の seq (送信済みでまだ届いていない結果は、受信側でこれ以下を捨てる)
+        """
+        with self._lock:
+            self._pending = None
+            self._discard_below = self._seq + 1
+            return self._seq
+
+    def _run(self, seq, job):
+        # 実行中に溜まった保留があれば、同じスレッドで続けて処理する (ビューポート内の順序を保つ)
+        while True:
+            try: result = job()
+            except Exception as e:
+                print(f"Render Error: {e}"); result = None
+            with self._lock: discard = seq < self._discard_below
+            if not discard:
+                # ビューポートが閉じられた後なら送り先は無い
+                try: self.frame_ready.emit(seq, result)
+                except RuntimeError: pass
+            with self._lock:
+                if self._pending is None:
+                    self._running = False
+                    return
+                seq, job = self._pending; self._pending = None
@@ -0,0 +1,90 @@
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset
+from core.windowing import apply_window_raw
+
+# --- 軽量シリーズ表現 ---
+# pydicom の Dataset (PixelData や全タグ) を保持せず、表示に必要なものだけを持つ
+
+# create_overlay_info / ウィンドウ初期値で使うタグ
+OVERLAY_TAGS = ('PatientName', 'PatientID', 'PatientSex', 'PatientAge', 'StudyDate',
+                'InstitutionName', 'SeriesDescription', 'Modality', 'WindowCenter', 'WindowWidth',
+                'ImageOrientationPatient', 'PixelSpacing', 'SeriesInstanceUID')
+
+class CompactSeries:
+    """
+    :param pixels: (N, H, W) の連続配列 (格納値のまま / int16・uint16 等)
+                   行列サイズが不揃いなシリーズでは2D配列のリスト
+    :param file_paths: 表示順のファイルパス (タグ表示時に読み直す)
+    :param slopes, intercepts: (N,) Rescale Slope / Intercept
+    :param positions: (N, 3) ImagePositionPatient (無いスライスは NaN)
+    :param meta: OVERLAY_TAGS だけを持つ小さな Dataset (先頭スライスから作成)
+    """
+    def __init__(self, pixels, file_paths, slopes, intercepts, positions, meta):
+        self.pixels = pixels
+        self.file_paths = list(file_paths)
+        self.slopes = np.asarray(slopes, dtype=np.float64)
+        self.intercepts = np.asarray(intercepts, dtype=np.float64)
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.meta = meta
+
+    def __len__(self):
+        return len(self.file_paths)
+
+    @property
+    def is_stacked(self):
+        return isinstance(self.pixels, np.ndarray)
+
+    @property
+    def pixel_spacing(self):
+        if 'PixelSpacing' not in self.meta: return None
+        try: return [float(x) for x in self.meta.PixelSpacing]
+        except Exception: return None
+
+    @property
+    def orientation(self):
+        if 'ImageOrientationPatient' not in self.meta: return None
+        try: return [float(x) for x in self.meta.ImageOrientationPatient]
+        except Exception: return None
+
+    def get_hu_slice(self, index):
+        """スライスを float32 のCT値 (Rescale適用済み) で返す"""
+        # Python の float にしておかないと、NumPy 2 では float64 に昇格してしまう
+        slope = float(self.slopes[index]); intercept = float(self.intercepts[index])
+        return self.pixels[index].astype(np.float32) * slope + intercept
+
+    def window_slice(self, index, level, width):
+        """スライスを WL/WW で 8bit にする (整数の格納値は CT値を経由せず LUT で変換する)"""
+        return apply_window_raw(self.pixels[index], level, width, float(self.slopes[index]), float(self.intercepts[index]))
+
+    def get_hu_block(self, index, x0, y0, x1, y1):
+        """スライスの [x0, x1) x [y0, y1) だけを float32 のCT値で返す (プローブ・ROI用)"""
+        slope = float(self.slopes[index]); intercept = float(self.intercepts[index])
+        return self.pixels[index][y0:y1, x0:x1].astype(np.float32) * slope + intercept
+
+    def load_dataset(self, index):
+        """タグ表示用に、元のファイルから完全な Dataset を読み直す"""
+        return pydicom.dcmread(self.file_paths[index])
+
+    @property
+    def nbytes(self):
+        if self.is_stacked: return self.pixels.nbytes
+        return sum(p.nbytes for p in self.pixels)
+
+def extract_slice_info(ds):
+    """1スライス分の (slope, intercept, position) を取り出す"""
+    try: slope = float(ds.get('RescaleSlope', 1.0))
+    except Exception: slope = 1.0
+    try: intercept = float(ds.get('RescaleIntercept', 0.0))
+    except Exception: intercept = 0.0
+    try: position = [float(v) for v in ds.ImagePositionPatient][:3]
+    except Exception: position = [np.nan, np.nan, np.nan]
+    if len(position) != 3: position = [np.nan, np.nan, np.nan]
+    return slope, intercept, position
+
+def extract_meta(ds):
+    """オーバーレイ表示に必要なタグだけをコピーした Dataset を作る"""
+    meta = Dataset()
+    for tag in OVERLAY_TAGS:
+        if tag in ds: meta[tag] = ds[tag]
+    return meta
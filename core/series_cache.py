@@ -0,0 +1,209 @@
+import os
+import hashlib
+import weakref
+import numpy as np
+from collections import OrderedDict
+from PyQt6.QtCore import QObject, pyqtSignal
+from core.loader import SeriesLoadWorker, MprBuilderWorker
+
+# --- プロセス共通のシリーズ/ボリュームキャッシュ ---
+# 同じシリーズを複数のビューポートに表示しても、デコードとMPR構築は1回だけ行い、
+# 読み取り専用の配列を共有する。メモリ上限を超えたら最も古く使われたシリーズから解放する。
+
+def make_series_key(series_uid, file_paths):
+    """キャッシュキー: SeriesInstanceUID (無ければファイル一覧のハッシュ)"""
+    if series_uid: return str(series_uid)
+    h = hashlib.sha1('\n'.join(file_paths).encode('utf-8', 'surrogatepass'))
+    return 'files:' + h.hexdigest()
+
+def _set_readonly(series=None, volume=None):
+    # 共有配列をビューポート側で書き換えられないようにする
+    if series is not None:
+        arrays = [series.pixels] if series.is_stacked else series.pixels
+        for a in arrays: a.flags.writeable = False
+    if isinstance(volume, np.ndarray): volume.flags.writeable = False
+
+class _Entry:
+    def __init__(self, file_paths):
+        self.file_paths = list(file_paths)
+        self.series = None
+        self.volume = None
+        self.spacing = None
+        self.stats = None     # VolumeStats
+        self.grid = None      # VolumeGrid / 配列がそのままMPRの格子なら None
+
+    @property
+    def nbytes(self):
+        n = 0
+        if self.series is not None: n += self.series.nbytes
+        # ディスクキャッシュの memmap はページキャッシュ、ブリック分割ボリュームは自前の上限を持つので含めない
+        if isinstance(self.volume, np.ndarray) and not isinstance(self.volume, np.memmap): n += self.volume.nbytes
+        return n
+
+class SeriesCache(QObject):
+    series_ready = pyqtSignal(str, object)             # key, CompactSeries or None
+    series_progress = pyqtSignal(str, int)
+    volume_ready = pyqtSignal(str, object, object, object, object)   # key, volume or None, spacing, VolumeStats, VolumeGrid
+    volume_progress = pyqtSignal(str, int)
+
+    # 環境変数 ZETA_MEMORY_BUDGET_MB で上書き可能
+    DEFAULT_BUDGET_MB = 4096
+
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None: cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, budget_bytes=None, parent=None):
+        super().__init__(parent)
+        if budget_bytes is None:
+            try: budget_mb = float(os.environ.get('ZETA_MEMORY_BUDGET_MB', self.DEFAULT_BUDGET_MB))
+            except ValueError: budget_mb = self.DEFAULT_BUDGET_MB
+            budget_bytes = int(budget_mb * 1024 * 1024)
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()       # key -> _Entry (LRU順, 末尾が最新)
+        # 追い出した後もビューポートが表示中なら、弱参照から再利用する
+        self._evicted = {}                  # key -> (file_paths, series_ref, volume_ref, spacing, stats, grid)
+        self._series_jobs = {}              # key -> (worker, 待機中のビューポート)
+        self._volume_jobs = {}
+        self._retired_workers = []
+
+    # --- 公開API ---
+    def set_budget(self, budget_bytes):
+        self.budget_bytes = int(budget_bytes)
+        self._evict()
+
+    @property
+    def used_bytes(self):
+        return sum(e.nbytes for e in self._entries.values())
+
+    def request_series(self, key, file_paths, requester=None):
+        """
+        キャッシュ済みなら CompactSeries を返す。
+        無ければ読み込みを開始 (既に読み込み中ならそれに合流) して None を返し、
+        完了時に series_ready(key, series) を送る。
+        """
+        entry = self._get_entry(key, file_paths)
+        if entry.series is not None: return entry.series
+        job = self._series_jobs.get(key)
+        if job is None:
+            worker = SeriesLoadWorker(list(file_paths))
+            worker.progress.connect(lambda v, k=key: self.series_progress.emit(k, v))
+            worker.finished.connect(lambda s, k=key, w=worker: self._on_series_loaded(k, w, s))
+            job = (worker, weakref.WeakSet())
+            self._series_jobs[key] = job
+            worker.start()
+        if requester is not None: job[1].add(requester)
+        return None
+
+    def request_volume(self, key, file_paths, requester=None):
+        """キャッシュ済みなら (volume, spacing, stats, grid) を返す。無ければ構築を開始して None"""
+        entry = self._get_entry(key, file_paths)
+        if entry.volume is not None: return entry.volume, entry.spacing, entry.stats, entry.grid
+        job = self._volume_jobs.get(key)
+        if job is None:
+            # 読み込み済みのスライスがあれば、ディスクを読み直さずに組み立てる
+            worker = MprBuilderWorker(list(file_paths), series=entry.series, store_key=key)
+            worker.progress.connect(lambda v, k=key: self.volume_progress.emit(k, v))
+            worker.finished.connect(lambda v, sp, st, g, k=key, w=worker: self._on_volume_built(k, w, v, sp, st, g))
+            job = (worker, weakref.WeakSet())
+            self._volume_jobs[key] = job
+            worker.start()
+        if requester is not None: job[1].add(requester)
+        return None
+
+    def release(self, requester):
+        """requester の待機を取り消す。誰も待っていない読み込みはキャンセルする"""
+        for key, (worker, waiters) in list(self._series_jobs.items()):
+            waiters.discard(requester)
+            if len(waiters) == 0:
+                del self._series_jobs[key]
+                self._retire(worker)
+        # MPR構築は中断できないので、待機の取り消しだけ (結果はキャッシュされる)
+        for worker, waiters in self._volume_jobs.values(): waiters.discard(requester)
+
+    # --- 内部処理 ---
+    def _get_entry(self, key, file_paths):
+        entry = self._entries.get(key)
+        waiting = ((), ())
+        if entry is not None and entry.file_paths != list(file_paths):
+            # 同じUIDでもファイル構成が変わった (再スキャン等) 場合は作り直す
+            del self._entries[key]; entry = None
+            self._evicted.pop(key, None)
+            waiting = tuple(self._cancel_job(jobs, key) for jobs in (self._series_jobs, self._volume_jobs))
+        if entry is None:
+            entry = _Entry(file_paths)
+            self._revive(key, entry)
+            self._entries[key] = entry
+        self._entries.move_to_end(key)
+        # 前のファイル構成で待っていたビューポートは、新しいファイル構成のジョブで待たせ直す
+        # (結果はキーで受け取るので、そのまま新しいシリーズ・ボリュームを受け取れる)
+        for requester in waiting[0]: self.request_series(key, file_paths, requester)
+        for requester in waiting[1]: self.request_volume(key, file_paths, requester)
+        return entry
+
+    def _cancel_job(self, jobs, key):
+        """:return: 取り消したジョブを待っていたビューポート"""
+        job = jobs.pop(key, None)
+        if job is None: return ()
+        self._retire(job[0])
+        return list(job[1])
+
+    def _revive(self, key, entry):
+        evicted = self._evicted.pop(key, None)
+        if evicted is None: return
+        file_paths, series_ref, volume_ref, spacing, stats, grid = evicted
+        if file_paths != entry.file_paths: return
+        entry.series = series_ref() if series_ref else None
+        entry.volume = volume_ref() if volume_ref else None
+        if entry.volume is not None: entry.spacing = spacing; entry.stats = stats; entry.grid = grid
+
+    def _retire(self, worker):
+        # 実行中の QThread が GC されないよう、終了するまで参照を保持
+        for sig in (worker.finished, worker.progress):
+            try: sig.disconnect()
+            except TypeError: pass
+        if isinstance(worker, SeriesLoadWorker): worker.cancel()
+        self._retired_workers = [w for w in self._retired_workers if w.isRunning()]
+        self._retired_workers.append(worker)
+
+    def _on_series_loaded(self, key, worker, series):
+        job = self._series_jobs.get(key)
+        if job is None or job[0] is not worker: return
+        del self._series_jobs[key]
+        entry = self._entries.get(key)
+        if series is not None and entry is not None:
+            _set_readonly(series=series)
+            entry.series = series
+            self._evict(keep=key)
+        self.series_ready.emit(key, series)
+
+    def _on_volume_built(self, key, worker, volume, spacing, stats, grid):
+        job = self._volume_jobs.get(key)
+        if job is None or job[0] is not worker: return
+        del self._volume_jobs[key]
+        # 構築スレッドはボリュームを渡した後にディスクキャッシュへ保存するので、終わるまで参照を保持する
+        self._retire(worker)
+        entry = self._entries.get(key)
+        if volume is not None and entry is not None:
+            _set_readonly(volume=volume)
+            entry.volume = volume; entry.spacing = spacing; entry.stats = stats; entry.grid = grid
+            self._evict(keep=key)
+        self.volume_ready.emit(key, volume, spacing, stats, grid)
+
+    def _evict(self, keep=None):
+        # 弱参照が切れた退避エントリは捨てる
+        for k, (_, s_ref, v_ref, _, _, _) in list(self._evicted.items()):
+            if (s_ref is None or s_ref() is None) and (v_ref is None or v_ref() is None): del self._evicted[k]
+        used = self.used_bytes
+        for key in list(self._entries.keys()):
+            if used <= self.budget_bytes: break
+            if key == keep or key in self._series_jobs or key in self._volume_jobs: continue
+            entry = self._entries.pop(key)
+            used -= entry.nbytes
+            self._evicted[key] = (entry.file_paths,
+                                  weakref.ref(entry.series) if entry.series is not None else None,
+                                  weakref.ref(entry.volume) if entry.volume is not None else None,
+                                  entry.spacing, entry.stats, entry.grid)
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+from core.cache_paths import get_cache_dir
+
+# --- 永続シリーズインデックス ---
+# (path, size, mtime) が一致するファイルはヘッダを読み直さずに分類結果を再利用する
+
+class SeriesIndex:
+    SCHEMA_VERSION = 1
+
+    COLUMNS = ('series_uid', 'series_desc', 'modality', 'instance_number',
+               'pos_x', 'pos_y', 'pos_z', 'spacing_row', 'spacing_col', 'slice_thickness')
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(get_cache_dir(), 'series_index.sqlite3')
+        # スキャンワーカーのスレッド内で生成・使用する
+        self.conn = sqlite3.connect(self.db_path, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != self.SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS files")
+        # series_uid が NULL の行は「DICOMではない」ファイル (毎回読み直さないために記録)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                series_uid TEXT,
+                series_desc TEXT,
+                modality TEXT,
+                instance_number INTEGER,
+                pos_x REAL, pos_y REAL, pos_z REAL,
+                spacing_row REAL, spacing_col REAL,
+                slice_thickness REAL
+            )""")
+        self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def _prefix_range(folder):
+        prefix = os.path.join(os.path.abspath(folder), '')
+        return prefix, prefix + '\U0010ffff'
+
+    def lookup_folder(self, folder):
+        """フォルダ以下の登録済みエントリを {path: (size, mtime_ns, record or None)} で返す"""
+        lo, hi = self._prefix_range(folder)
+        rows = self.conn.execute(
+            f"SELECT path, size, mtime_ns, {', '.join(self.COLUMNS)} FROM files WHERE path >= ? AND path < ?",
+            (lo, hi))
+        entries = {}
+        for row in rows:
+            path, size, mtime_ns = row[:3]
+            entries[path] = (size, mtime_ns, self._row_to_record(row[3:]))
+        return entries
+
+    def store(self, entries):
+        """entries: [(path, size, mtime_ns, record or None)]"""
+        rows = [(path, size, mtime_ns) + self._record_to_row(record) for path, size, mtime_ns, record in entries]
+        placeholders = ', '.join('?' * (3 + len(self.COLUMNS)))
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO files (path, size, mtime_ns, {', '.join(self.COLUMNS)}) VALUES ({placeholders})",
+            rows)
+        self.conn.commit()
+
+    def remove(self, paths):
+        self.conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in paths])
+        self.conn.commit()
+
+    @staticmethod
+    def _record_to_row(record):
+        if record is None: return (None,) * len(SeriesIndex.COLUMNS)
+        pos = record.get('position') or (None, None, None)
+        spacing = record.get('spacing') or (None, None)
+        return (record['uid'], record['desc'], record['modality'], record.get('instance'),
+                pos[0], pos[1], pos[2], spacing[0], spacing[1], record.get('thickness'))
+
+    @staticmethod
+    def _row_to_record(row):
+        uid, desc, modality, instance, px, py, pz, sr, sc, thickness = row
+        if uid is None: return None
+        return {
+            'uid': uid, 'desc': desc, 'modality': modality, 'instance': instance,
+            'position': (px, py, pz) if px is not None else None,
+            'spacing': (sr, sc) if sr is not None else None,
+            'thickness': thickness,
+        }
@@ -0,0 +1,121 @@
+import os
+import numpy as np
+
+# --- 厚いスラブのページング用キャッシュ ---
+# スラブの各層は法線方向の固定格子上にあるので、1枚ページングしても層はほとんど前のフレームと同じ。
+# サンプリング済みの層を保持し、入ってくる層だけをサンプリングして投影を差分更新する。
+#   AVG        : 保持している層を順に足す (キャッシュ無しの描画と同じ順序・精度で、結果を一致させる)
+#   MIP / MinIP: 2本のスタックで作る両端キュー (各スタックに中央からの累積 max/min を持つ) で、
+#                1枚あたり定数回の max/min で更新する (片方が空になったら中央で分け直す)
+
+_REDUCE = {'MIP': np.maximum, 'MinIP': np.minimum}
+
+class SlabCache:
+    """
+    1ビューポート分のスラブ層キャッシュ。描画スレッドから順に呼ばれる前提 (ロックしない)
+    """
+    # 環境変数 ZETA_SLAB_CACHE_MB で上書き可能
+    DEFAULT_LIMIT_MB = 256
+
+    def __init__(self, limit_bytes=None):
+        if limit_bytes is None:
+            try: limit_mb = float(os.environ.get('ZETA_SLAB_CACHE_MB', self.DEFAULT_LIMIT_MB))
+            except ValueError: limit_mb = self.DEFAULT_LIMIT_MB
+            limit_bytes = int(limit_mb * 1024 * 1024)
+        self.limit_bytes = limit_bytes
+        self.clear()
+
+    def clear(self):
+        self._key = None; self._mode = None
+        self._lo = self._hi = None         # 保持している層の範囲 (格子番号、両端を含む)
+        self._layers = {}                  # 格子番号 -> (H, W) float32
+        self._mid = None                   # MIP/MinIP: 前側スタック [lo, mid) と後側スタック [mid, hi] の境目
+        self._front = {}                   # k -> reduce(layers[k:mid])
+        self._back = {}                    # k -> reduce(layers[mid:k+1])
+
+    def project(self, key, layer_ids, mode, sample, plane_shape):
+        """
+        :param key: 格子番号以外の断面の条件 (向き・法線方向以外の位置・出力格子など)
+        :param layer_ids: スラブの層の格子番号 (連続した整数)
+        :param sample: sample(ids) -> (len(ids), H, W) float32 で層をサンプリングする関数
+        :return: 投影結果 (H, W) float32 / キャッシュしない場合は None (呼び出し元で通常通り計算する)
+        """
+        lo, hi = int(layer_ids[0]), int(layer_ids[-1])
+        if key != self._key or mode != self._mode:
+            # 回転中のように毎回条件が変わる描画では層を溜めても無駄なので、
+            # 同じ条件の描画が2回続いた時 (= ページング) から使い始める
+            self.clear(); self._key = key; self._mode = mode
+            return None
+        width = hi - lo + 1
+        per_layer = plane_shape[0] * plane_shape[1] * 4
+        if width * per_layer * (1 if mode not in _REDUCE else 2) > self.limit_bytes: return None
+
+        if self._lo is None or width != self._hi - self._lo + 1 or abs(lo - self._lo) >= width:
+            self._rebuild(lo, hi, sample, plane_shape)
+        elif lo > self._lo:
+            self._slide_forward(lo, hi, sample)
+        elif lo < self._lo:
+            self._slide_backward(lo, hi, sample)
+        return self._result()
+
+    # --- 内部処理 ---
+    def _add_layers(self, ids, sample):
+        ids = np.asarray(ids)
+        layers = sample(ids)
+        for k, layer in zip(ids, layers): self._layers[int(k)] = layer
+
+    def _rebuild(self, lo, hi, sample, plane_shape):
+        key, mode = self._key, self._mode
+        self.clear(); self._key = key; self._mode = mode
+        # 一度にサンプリングする層数を抑えて、一時配列の大きさを層1枚分の数倍に留める
+        chunk = max(1, (1 << 20) // max(1, plane_shape[0] * plane_shape[1]))
+        for k0 in range(lo, hi + 1, chunk): self._add_layers(np.arange(k0, min(hi, k0 + chunk - 1) + 1), sample)
+        self._lo, self._hi = lo, hi
+        if mode in _REDUCE: self._split()
+
+    def _split(self):
+        # 保持している層を中央で前後のスタックに分け、それぞれ中央からの累積を作り直す
+        reduce = _REDUCE[self._mode]
+        lo, hi = self._lo, self._hi
+        self._mid = mid = (lo + hi + 1) // 2
+        self._front = {}; self._back = {}
+        for k in range(mid - 1, lo - 1, -1):
+            self._front[k] = self._layers[k] if k == mid - 1 else reduce(self._layers[k], self._front[k + 1])
+        for k in range(mid, hi + 1):
+            self._back[k] = self._layers[k] if k == mid else reduce(self._back[k - 1], self._layers[k])
+
+    def _slide_forward(self, lo, hi, sample):
+        entering = range(self._hi + 1, hi + 1); leaving = range(self._lo, lo)
+        self._add_layers(list(entering), sample)
+        if self._mode in _REDUCE:
+            reduce = _REDUCE[self._mode]
+            for k in entering:
+                self._back[k] = self._layers[k] if k == self._mid else reduce(self._back[k - 1], self._layers[k])
+        for k in leaving:
+            del self._layers[k]; self._front.pop(k, None)
+        self._lo, self._hi = lo, hi
+        # 前側スタックを使い切ったら、後側の累積に出て行った層が含まれるので分け直す
+        if self._mode in _REDUCE and lo > self._mid: self._split()
+
+    def _slide_backward(self, lo, hi, sample):
+        entering = range(self._lo - 1, lo - 1, -1); leaving = range(hi + 1, self._hi + 1)
+        self._add_layers(list(entering), sample)
+        if self._mode in _REDUCE:
+            reduce = _REDUCE[self._mode]
+            for k in entering:
+                self._front[k] = self._layers[k] if k == self._mid - 1 else reduce(self._layers[k], self._front[k + 1])
+        for k in leaving:
+            del self._layers[k]; self._back.pop(k, None)
+        self._lo, self._hi = lo, hi
+        if self._mode in _REDUCE and hi < self._mid - 1: self._split()
+
+    def _result(self):
+        if self._mode not in _REDUCE:
+            # core.mpr_logic._fold_chunks と同じく、float32 で1枚ずつ足した和を枚数で割る
+            acc = self._layers[self._lo].copy()
+            for k in range(self._lo + 1, self._hi + 1): np.add(acc, self._layers[k], out=acc)
+            return np.true_divide(acc, np.intp(self._hi - self._lo + 1), out=acc, casting='unsafe')
+        lo, hi, mid = self._lo, self._hi, self._mid
+        if lo >= mid: return self._back[hi].copy()
+        if hi < mid: return self._front[lo].copy()
+        return _REDUCE[self._mode](self._front[lo], self._back[hi])
@@ -0,0 +1,299 @@
+import threading
+import weakref
+import numpy as np
+from scipy import ndimage
+
+# --- ボリューム統計 ---
+# 最小値 (範囲外の塗りつぶし値)・最大値・CT値ヒストグラムを、ボリューム構築時に1回だけ計算して持ち回る。
+# 描画のたびにボリューム全体を走査しなくて済み、自動ウィンドウもヒストグラムから即座に求まる。
+
+class VolumeStats:
+    """
+    :param minimum, maximum: 全ボクセルの最小値・最大値
+    :param hist: ヒストグラム (int64)。ビン i は [lo + i*bin_width, lo + (i+1)*bin_width)
+    :param lo, bin_width: ヒストグラムの下端とビン幅 (整数ボリュームは 1 HU 刻みなので、各ビンがちょうど1つの値)
+    """
+    MAX_BINS = 65536
+    CHUNK_VOXELS = 1 << 24   # 一度に読むボクセル数 (memmap でも全体をメモリに載せない)
+    PERCENTILES = (0.5, 1, 5, 25, 50, 75, 95, 99, 99.5)
+
+    def __init__(self, minimum, maximum, hist, lo, bin_width):
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.hist = np.asarray(hist, dtype=np.int64)
+        self.lo = float(lo)
+        self.bin_width = float(bin_width)
+        self._cum = np.cumsum(self.hist)
+
+    @classmethod
+    def from_volume(cls, volume):
+        """ボリュームを先頭軸方向に分割して2回走査する (最小/最大 -> ヒストグラム)"""
+        # ndarray 以外 (BrickedVolume) はスライスで取り出すたびに読み込むので、チャンクは都度取り出す
+        if not hasattr(volume, 'shape'): volume = np.asarray(volume)
+        if volume.size == 0: return cls(0.0, 0.0, [0], 0.0, 1.0)
+        n = max(1, cls.CHUNK_VOXELS // max(1, int(np.prod(volume.shape[1:])))) if volume.ndim > 1 else volume.shape[0]
+        chunks = lambda: (volume[i:i + n] for i in range(0, volume.shape[0], n))
+        minimum = np.inf; maximum = -np.inf
+        for c in chunks(): minimum = min(minimum, float(c.min())); maximum = max(maximum, float(c.max()))
+        if not (np.isfinite(minimum) and np.isfinite(maximum)):
+            raise ValueError("volume contains non-finite values")
+
+        lo = float(np.floor(minimum))
+        bin_width = 1.0
+        n_bins = int(np.floor(maximum - lo)) + 1
+        if n_bins > cls.MAX_BINS:
+            bin_width = (maximum - lo) / (cls.MAX_BINS - 1); n_bins = cls.MAX_BINS
+        hist = np.zeros(n_bins, dtype=np.int64)
+        integer = np.issubdtype(volume.dtype, np.integer) and bin_width == 1.0
+        for c in chunks():
+            if integer: idx = c.astype(np.int32).ravel() - int(lo)
+            else: idx = np.clip(((c.ravel() - lo) / bin_width).astype(np.int64), 0, n_bins - 1)
+            hist += np.bincount(idx, minlength=n_bins)
+        return cls(minimum, maximum, hist, lo, bin_width)
+
+    @classmethod
+    def from_counts(cls, counts, lo):
+        """
+        整数値ごとの度数から作る (ボリュームを組み立てながら数える場合)
+        :param counts: counts[i] が値 lo + i のボクセル数
+        """
+        nz = np.flatnonzero(counts)
+        if len(nz) == 0: return cls(0.0, 0.0, [0], 0.0, 1.0)
+        first, last = int(nz[0]), int(nz[-1])
+        return cls(lo + first, lo + last, counts[first:last + 1], lo + first, 1.0)
+
+    @property
+    def count(self):
+        return int(self._cum[-1])
+
+    def percentile(self, q, exclude_minimum=False):
+        """
+        ヒストグラムから求めたパーセンタイル値 (ビンの下端 / 整数ボリュームでは正確な値)
+        :param exclude_minimum: 最小値のビン (撮影範囲外の塗りつぶし・回転補正の余白) を除いて数える
+        """
+        cum = self._cum
+        start = 0
+        if exclude_minimum and len(self.hist) > 1 and cum[-1] > self.hist[0]:
+            start = int(self.hist[0])
+        total = int(cum[-1]) - start
+        if total <= 0: return self.minimum
+        target = start + min(max(q, 0.0), 100.0) / 100.0 * total
+        i = int(np.searchsorted(cum, max(target, start + 1), side='left'))
+        i = min(i, len(self.hist) - 1)
+        return float(min(max(self.lo + i * self.bin_width, self.minimum), self.maximum))
+
+    @property
+    def percentiles(self):
+        return {q: self.percentile(q) for q in self.PERCENTILES}
+
+    def auto_window(self, low=1.0, high=99.0):
+        """背景を除いた low〜high パーセンタイルが収まるウィンドウ :return: (level, width)"""
+        v0 = self.percentile(low, exclude_minimum=True); v1 = self.percentile(high, exclude_minimum=True)
+        width = max(1.0, v1 - v0)
+        return (v0 + v1) / 2.0, width
+
+    # --- ディスクキャッシュのヘッダ用 ---
+    def to_dict(self):
+        # 先頭・末尾の空ビンは保存しない
+        nz = np.flatnonzero(self.hist)
+        first = int(nz[0]) if len(nz) else 0; last = int(nz[-1]) + 1 if len(nz) else 1
+        return {'min': self.minimum, 'max': self.maximum, 'lo': self.lo + first * self.bin_width,
+                'bin_width': self.bin_width, 'hist': self.hist[first:last].tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['min'], d['max'], d['hist'], d['lo'], d['bin_width'])
+
+# --- 保持している配列とMPRの座標系の対応 ---
+# ビューポートはMPRの座標系 (撮影時の原点・間隔で、患者座標の軸に沿った直交格子のボクセル座標) で断面を扱う。
+# 保持している配列がその格子そのものでない場合 (体の範囲での切り出し・斜めの撮影) は、
+# VolumeGrid を一緒に持ち回り、サンプリングの直前に中心とベクトルを配列の添字に直す。
+
+class VolumeGrid:
+    """
+    MPRの座標 p (x, y, z) の点は、撮影時の格子の添字 M p (M = S^-1 D^-1 S、D は方向余弦の行列、S は間隔) にあり、
+    配列の添字はそこから offset を引いたもの。斜めの撮影でもボリューム全体を直交格子に再サンプリングせず、
+    表示する断面ごとに元のボクセルから1回だけ補間する
+    """
+    def __init__(self, shape, spacing, offset=None, direction=None):
+        self.shape = tuple(int(n) for n in shape)   # MPRの座標系の格子の大きさ (Z, Y, X)
+        # 体の範囲で切り出した場合の、配列の原点の撮影時の格子での位置 (z, y, x)
+        self.offset = tuple(int(v) for v in offset) if offset is not None else (0, 0, 0)
+        # 斜めの撮影の方向余弦 (SimpleITK の並び、9要素) / 直交なら None
+        self.direction = tuple(float(v) for v in direction) if direction is not None else None
+        self.matrix = None
+        if self.direction is not None:
+            s = np.array(spacing[::-1], dtype=np.float64)   # (sx, sy, sz)
+            self.matrix = np.linalg.inv(np.array(self.direction).reshape(3, 3)) * s[None, :] / s[:, None]
+
+    @property
+    def anchor(self):
+        """配列の原点の、撮影時の格子での位置 (x, y, z)"""
+        return np.array(self.offset[::-1], dtype=np.float64)
+
+    def to_array(self, center, vectors):
+        """MPRの座標系の中心とベクトルを、配列の添字 (x, y, z) に直す"""
+        center = np.asarray(center, dtype=np.float64)
+        if self.matrix is not None:
+            center = self.matrix @ center
+            vectors = tuple(self.matrix @ np.asarray(v, dtype=np.float64) for v in vectors)
+        return tuple(center - self.anchor), vectors
+
+    def to_dict(self):
+        return {'shape': list(self.shape), 'offset': list(self.offset),
+                'direction': list(self.direction) if self.direction is not None else None}
+
+    @classmethod
+    def from_dict(cls, d, spacing):
+        return cls(d['shape'], spacing, d.get('offset'), d.get('direction'))
+
+# --- 体の範囲での切り出し ---
+# CTボリュームの大半は体と寝台の外の空気なので、体を含む直方体だけを保持する。
+# 切り出した位置は VolumeGrid の offset で持ち回り、ビューポートは元の格子の座標のまま扱う。
+# 切り出した外側は、ボリュームの範囲外と同じく最小値で埋まる。
+
+BODY_THRESHOLD = -500.0   # これより高い CT値を体 (と寝台) とみなす
+CROP_FACTOR = 4           # 判定は各軸 1/4 に間引いたコピーで行う
+CROP_MARGIN = 8           # 切り出し範囲の余白 (ボクセル)
+CROP_MIN_REMOVED = 0.1    # 削れるボクセルがこの割合未満なら切り出さない
+
+def find_body_bounds(volume, threshold=BODY_THRESHOLD, factor=CROP_FACTOR, margin=CROP_MARGIN):
+    """
+    体を含む直方体の範囲を、間引いたコピーのしきい値処理で求める
+    :return: ((z0, z1), (y0, y1), (x0, x1)) / しきい値を超えるものが無ければ None
+    """
+    mask = np.asarray(volume[::factor, ::factor, ::factor]) > threshold
+    if not mask.any(): return None
+    # ノイズやアーチファクトの小さな欠片は除き、体・腕・寝台のような大きな塊だけを残す
+    labels, _ = ndimage.label(mask)
+    sizes = np.bincount(labels.ravel()); sizes[0] = 0
+    mask = np.isin(labels, np.flatnonzero(sizes >= max(1, 0.01 * sizes.sum())))
+    bounds = []
+    for axis in range(3):
+        hit = np.flatnonzero(mask.any(axis=tuple(a for a in range(3) if a != axis)))
+        # 間引いた1ボクセルは元の factor ボクセル分なので、その分も広げる
+        lo = max(0, (int(hit[0]) - 1) * factor - margin)
+        hi = min(volume.shape[axis], (int(hit[-1]) + 1) * factor + margin)
+        bounds.append((lo, hi))
+    return tuple(bounds)
+
+def crop_to_body(volume, min_removed=CROP_MIN_REMOVED):
+    """
+    体の範囲だけを切り出したコピーを作る
+    :return: (volume, offset) / offset は切り出した範囲の原点 (z, y, x)。切り出さなかった場合は (volume, None)
+    """
+    bounds = find_body_bounds(volume)
+    if bounds is None: return volume, None
+    kept = np.prod([hi - lo for lo, hi in bounds])
+    if kept > (1.0 - min_removed) * volume.size: return volume, None
+    sub = np.ascontiguousarray(volume[tuple(slice(lo, hi) for lo, hi in bounds)])
+    return sub, tuple(lo for lo, _ in bounds)
+
+# --- 多重解像度ピラミッド ---
+# 巨大なボリューム (数千スライス) は、縮小表示や操作中の簡易描画でも全解像度を読むとキャッシュ効率が悪い。
+# 2倍・4倍… に縮小したボリュームをバックグラウンドで作っておき、画面上のサンプリング密度に合った段を使う。
+
+class VolumePyramid:
+    """
+    段 k (k >= 1) は元のボリュームを各軸 2**k 分の1に平均縮小したもの (奇数サイズの端は1ボクセルだけで平均)。
+    段 k のボクセル j の中心は元の座標 f*j + (f-1)/2 (f = 2**k) にあたる。
+    元のボリュームは弱参照で持つ (キャッシュから追い出されたら一緒に消える)。
+    """
+    MAX_LEVELS = 3                 # 8倍まで
+    MIN_LEVEL_SIZE = 64            # これより小さい軸になる段は作らない
+    MIN_VOXELS = 64 * 1024 * 1024  # これより小さいボリュームにはピラミッドを作らない (十分速い)
+
+    def __init__(self, volume):
+        self._base = weakref.ref(volume)
+        self.shape = volume.shape
+        self.dtype = volume.dtype
+        n = 0
+        while n < self.MAX_LEVELS and min(self.shape) // (2 ** (n + 1)) >= self.MIN_LEVEL_SIZE: n += 1
+        self.num_levels = n
+        self._levels = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def build_async(self):
+        """全段をバックグラウンドで作り始める (描画側は出来ている段だけを使う)"""
+        if self._thread is None and self.num_levels > 0:
+            self._thread = threading.Thread(target=self._build_all, name='zeta-pyramid', daemon=True)
+            self._thread.start()
+
+    def _build_all(self):
+        try:
+            for k in range(1, self.num_levels + 1):
+                if self.level(k) is None: return
+        except Exception as e:
+            print(f"Volume pyramid build failed: {e}")
+
+    def level(self, k):
+        """段 k を返す (無ければ作る)。元のボリュームが既に無ければ None"""
+        if k == 0: return self._base()
+        with self._lock: lvl = self._levels.get(k)
+        if lvl is not None: return lvl
+        src = self.level(k - 1)
+        if src is None: return None
+        lvl = _downsample2(src)
+        with self._lock: self._levels[k] = lvl
+        return lvl
+
+    def select(self, center, vectors, step):
+        """
+        出力1画素あたりの移動量 (ボクセル) に合った、作成済みの段を選ぶ
+        :param vectors: (right, down, normal) / step: 出力1画素あたりの (right, down) の刻み
+        :return: (volume, center, vectors) 段の座標系に変換したもの / 元の段なら volume は None
+        """
+        density = min(np.linalg.norm(vectors[0]) * abs(step[0]), np.linalg.norm(vectors[1]) * abs(step[1]))
+        want = min(int(np.floor(np.log2(density))), self.num_levels) if density >= 2 else 0
+        for k in range(want, 0, -1):
+            with self._lock: lvl = self._levels.get(k)
+            if lvl is None: continue
+            f = float(2 ** k)
+            # 元の座標 c は段 k では (c - (f-1)/2) / f
+            c = tuple((float(v) - (f - 1) / 2) / f for v in center)
+            return lvl, c, tuple(np.asarray(v, dtype=np.float64) / f for v in vectors)
+        return None, center, vectors
+
+    @property
+    def nbytes(self):
+        with self._lock: return sum(l.nbytes for l in self._levels.values())
+
+def _downsample2(volume):
+    """各軸 1/2 の平均縮小 (Z方向に分割して処理し、元のボリューム全体の一時コピーは作らない)"""
+    nz, ny, nx = volume.shape
+    out = np.empty(((nz + 1) // 2, (ny + 1) // 2, (nx + 1) // 2), dtype=volume.dtype)
+    integer = np.issubdtype(volume.dtype, np.integer)
+    for k in range(out.shape[0]):
+        block = volume[2 * k:2 * k + 2].astype(np.float32)
+        acc = block.sum(axis=0) / block.shape[0]
+        for axis in (0, 1):
+            n = acc.shape[axis]
+            even = acc.take(np.arange(0, n - 1, 2), axis=axis) + acc.take(np.arange(1, n, 2), axis=axis)
+            even *= 0.5
+            if n % 2: even = np.concatenate([even, acc.take([n - 1], axis=axis)], axis=axis)
+            acc = even
+        out[k] = np.round(acc) if integer else acc
+    return out
+
+_pyramids = {}
+_pyramids_lock = threading.Lock()
+
+def get_pyramid(volume):
+    """
+    volume のピラミッド (ビューポート間で共有)。小さいボリュームなら None
+    初回の呼び出しでバックグラウンドの作成を始める
+    """
+    # ブリック分割ボリューム (core.bricked_volume) は縮小段でもメモリに載りきらないことがあるので作らない
+    if not isinstance(volume, np.ndarray) or volume.size < VolumePyramid.MIN_VOXELS: return None
+    key = id(volume)
+    with _pyramids_lock:
+        entry = _pyramids.get(key)
+        if entry is not None and entry[0]() is volume: return entry[1]
+        pyramid = VolumePyramid(volume)
+        if pyramid.num_levels == 0: return None
+        # ボリュームが解放されたら登録も消す
+        ref = weakref.ref(volume, lambda _, k=key: _pyramids.pop(k, None))
+        _pyramids[key] = (ref, pyramid)
+    pyramid.build_async()
+    return pyramid
@@ -0,0 +1,154 @@
+import os
+import json
+import hashlib
+import numpy as np
+from core.cache_paths import get_cache_dir
+from core.volume import VolumeStats, VolumeGrid
+from core.bricked_volume import BrickedVolume, BrickWriter
+
+# --- MPRボリュームのディスクキャッシュ ---
+# 構築済みのボリューム (値が収まれば int16、それ以外は float32) を .npy + JSONヘッダで保存し、次回以降は np.load(mmap_mode='r') で
+# コピー無しに開く。ページキャッシュは OS がビューポート間・プロセス間で共有する。
+# メモリに載らない大きさのボリュームはブリック分割 (core.bricked_volume) で書き、BrickedVolume で開く
+# (ヘッダの 'layout' が 'bricked'。無ければ従来の1つの配列)。
+
+class VolumeStore:
+    FORMAT_VERSION = 4   # 2: int16 格納に対応 / 3: ボリューム統計 (VolumeStats) を保存
+                         # 4: 配列とMPRの座標系の対応 (VolumeGrid: 切り出し・斜めの撮影) を 'grid' に保存
+    # 環境変数 ZETA_VOLUME_CACHE_MB で上書き可能
+    DEFAULT_LIMIT_MB = 8192
+
+    def __init__(self, root=None, limit_bytes=None):
+        self.root = root or get_cache_dir('volumes')
+        if limit_bytes is None:
+            try: limit_mb = float(os.environ.get('ZETA_VOLUME_CACHE_MB', self.DEFAULT_LIMIT_MB))
+            except ValueError: limit_mb = self.DEFAULT_LIMIT_MB
+            limit_bytes = int(limit_mb * 1024 * 1024)
+        self.limit_bytes = limit_bytes
+
+    @staticmethod
+    def fingerprint(file_paths):
+        """ファイル構成 (パス・サイズ・更新時刻) のハッシュ。どれかが変われば別ボリューム扱い"""
+        h = hashlib.sha1()
+        for path in sorted(file_paths):
+            st = os.stat(path)
+            h.update(f"{path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode('utf-8', 'surrogatepass'))
+        return h.hexdigest()
+
+    def _paths(self, key, file_paths):
+        name = hashlib.sha1(f"{key}\0{self.fingerprint(file_paths)}".encode('utf-8', 'surrogatepass')).hexdigest()
+        base = os.path.join(self.root, name)
+        return base + '.npy', base + '.json'
+
+    def load(self, key, file_paths):
+        """
+        :return: (読み取り専用 memmap または BrickedVolume の volume, spacing, origin, VolumeStats or None, VolumeGrid or None)
+                 / 無ければ None
+        """
+        try:
+            npy_path, json_path = self._paths(key, file_paths)
+            if not (os.path.exists(npy_path) and os.path.exists(json_path)): return None
+            with open(json_path, 'r', encoding='utf-8') as f: header = json.load(f)
+            if header.get('version') != self.FORMAT_VERSION: return None
+            if header.get('layout') == 'bricked':
+                volume = BrickedVolume(npy_path, header['shape'], header['dtype'])
+            else:
+                volume = np.load(npy_path, mmap_mode='r')
+                if list(volume.shape) != header['shape'] or str(volume.dtype) != header['dtype']: return None
+            os.utime(json_path)   # 最近使ったものとして残す
+            origin = tuple(header['origin']) if header.get('origin') is not None else None
+            stats = VolumeStats.from_dict(header['stats']) if header.get('stats') else None
+            spacing = tuple(header['spacing'])
+            grid = VolumeGrid.from_dict(header['grid'], spacing) if header.get('grid') else None
+            return volume, spacing, origin, stats, grid
+        except Exception as e:
+            print(f"Volume cache read failed: {e}")
+            return None
+
+    def save(self, key, file_paths, volume, spacing, origin=None, stats=None, grid=None):
+        npy_path, json_path = self._paths(key, file_paths)
+        header = self._header(key, volume.shape, volume.dtype, spacing, origin, stats, grid)
+        tmp_npy = npy_path + '.tmp'
+        try:
+            # 書き込み途中のファイルを読まれないよう、一時ファイルから置き換える (ヘッダが最後)
+            with open(tmp_npy, 'wb') as f: np.save(f, np.ascontiguousarray(volume))
+        except Exception as e:
+            print(f"Volume cache write failed: {e}")
+            self._remove(tmp_npy)
+            return
+        self._commit(tmp_npy, npy_path, json_path, header)
+
+    def create_bricked(self, key, file_paths, shape, dtype):
+        """
+        ブリック分割で直接書き込むための BrickWriter (一時ファイル)。
+        全スライスを書いたら commit_bricked、途中でやめるなら writer.abort()
+        """
+        npy_path, _ = self._paths(key, file_paths)
+        return BrickWriter(npy_path + '.tmp', shape, dtype)
+
+    def commit_bricked(self, key, file_paths, writer, spacing, origin=None, stats=None, grid=None):
+        """:return: 保存できたら True (ブリック分割のボリュームはこのファイルしか無いので、呼び出し元で確認する)"""
+        npy_path, json_path = self._paths(key, file_paths)
+        try: writer.close()
+        except Exception as e:
+            print(f"Volume cache write failed: {e}")
+            writer.abort()
+            return False
+        header = self._header(key, writer.shape, writer.dtype, spacing, origin, stats, grid)
+        header['layout'] = 'bricked'; header['brick'] = writer.brick
+        return self._commit(writer.path, npy_path, json_path, header)
+
+    def _header(self, key, shape, dtype, spacing, origin, stats, grid=None):
+        return {
+            'version': self.FORMAT_VERSION, 'key': key,
+            'shape': [int(n) for n in shape], 'dtype': str(np.dtype(dtype)),
+            'spacing': [float(v) for v in spacing],
+            'origin': [float(v) for v in origin] if origin is not None else None,
+            'stats': stats.to_dict() if stats is not None else None,
+            'grid': grid.to_dict() if grid is not None else None,
+        }
+
+    def _commit(self, tmp_npy, npy_path, json_path, header):
+        tmp_json = json_path + '.tmp'
+        try:
+            with open(tmp_json, 'w', encoding='utf-8') as f: json.dump(header, f)
+            os.replace(tmp_npy, npy_path); os.replace(tmp_json, json_path)
+        except Exception as e:
+            print(f"Volume cache write failed: {e}")
+            for p in (tmp_npy, tmp_json): self._remove(p)
+            return False
+        # 書いたばかりのものは上限より大きくても消さない (ブリック分割のボリュームは上限を超えうる)
+        self.prune(keep=npy_path)
+        return True
+
+    @staticmethod
+    def _remove(path):
+        try: os.remove(path)
+        except OSError: pass
+
+    def prune(self, keep=None):
+        """
+        上限を超えた分を、古く使われたものから削除する
+        :param keep: 削除しない .npy のパス (大きさは合計に数える)
+        """
+        entries = []; total = 0
+        try:
+            with os.scandir(self.root) as it:
+                for entry in it:
+                    if not entry.name.endswith('.json'): continue
+                    npy_path = entry.path[:-5] + '.npy'
+                    try: size = os.path.getsize(npy_path) + entry.stat().st_size
+                    except OSError: size = entry.stat().st_size
+                    entries.append((entry.stat().st_mtime, entry.path, npy_path, size)); total += size
+        except OSError: return
+        entries.sort()
+        for _, json_path, npy_path, size in entries:
+            if total <= self.limit_bytes: break
+            if npy_path == keep: continue
+            # Windows では memmap 中のファイルは消せないので、次回に回す
+            try: os.remove(npy_path)
+            except FileNotFoundError: pass
+            except OSError: continue
+            try: os.remove(json_path)
+            except OSError: pass
+            total -= size
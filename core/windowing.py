@@ -0,0 +1,40 @@
+import functools
+import numpy as np
+
+# --- ウィンドウ処理 (CT値 -> 8bit表示) ---
+# GUIスレッドと描画スレッドの両方から呼ばれるので、Qt には依存させない
+
+def apply_window(hu_image, level, width):
+    """CT値画像を WL/WW で 8bit グレースケールに変換する (C連続の uint8 を返す)"""
+    min_v = level - (width / 2.0); max_v = level + (width / 2.0)
+    img_windowed = np.clip(hu_image, min_v, max_v)
+    div = max_v - min_v
+    if div == 0: div = 1
+    return np.ascontiguousarray(((img_windowed - min_v) / div * 255).astype(np.uint8))
+
+# --- 整数の格納値の LUT ウィンドウ処理 ---
+# CT/MR の格納値は 16bit 以下の整数なので、(WL, WW, Slope, Intercept) ごとに全格納値 65536 通りの
+# 表示値を1回だけ計算しておき、画素ごとの処理は np.take 1回で済ませる (float32 への変換・clip・除算をしない)。
+# 表の値は apply_window と同じ float32 の計算で作るので、結果は float 経路と一致する。
+
+@functools.lru_cache(maxsize=16)
+def window_lut(level, width, slope=1.0, intercept=0.0, signed=True):
+    """
+    格納値 (16bit のビット列を uint16 として見た値) -> 8bit の表 (65536要素)
+    :param signed: 格納値が int16 なら True (32768 以上は負の値として計算する)
+    """
+    values = np.arange(65536, dtype=np.uint16)
+    if signed: values = values.view(np.int16)
+    lut = apply_window(values.astype(np.float32) * float(slope) + float(intercept), level, width)
+    lut.flags.writeable = False
+    return lut
+
+def apply_window_raw(raw, level, width, slope=1.0, intercept=0.0):
+    """
+    格納値のままの画像を Rescale + WL/WW で 8bit にする (C連続の uint8 を返す)
+    int16 / uint16 / uint8 は LUT で、それ以外 (float 等) は CT値に変換して apply_window で処理する
+    """
+    if raw.dtype in (np.int16, np.uint16, np.uint8):
+        lut = window_lut(float(level), float(width), float(slope), float(intercept), raw.dtype == np.int16)
+        return np.take(lut, raw.view(np.uint16) if raw.dtype == np.int16 else raw)
+    return apply_window(raw.astype(np.float32) * float(slope) + float(intercept), level, width)
@@ -20,6 +20,11 @@ class ImageCanvas(QWidget):
         super().__init__(parent)
         self.pixmap = None
         self.hu_grid = None 
+        # 論理画像 (計測・ROI・リファレンス線の座標系) と、pixmap が描画している範囲
+        # MPRでは画面に見えている範囲だけを画面解像度で描画するため、両者が一致しない
+        self.image_size = None      # (w, h) / None なら pixmap のサイズ
+        self.source_rect = None     # pixmap が覆う論理画像上の範囲 (QRectF) / None なら全体
+        self.hu_sampler = None      # (x0, y0, x1, y1) -> 論理解像度のCT値 / None なら hu_grid を使う
         self.pan_x = 0
         self.pan_y = 0
         self.zoom_factor = 1.0
@@ -51,11 +56,15 @@ class ImageCanvas(QWidget):
         # ★追加: マウス追跡を有効化 (これでクリックなしでも moveEvent が発生する)
         self.setMouseTracking(True)
 
-    def set_pixmap(self, pixmap, pixel_spacing=None, slice_index=0, hu_grid=None, overlay_data=None, aspect_ratio=1.0):
+    def set_pixmap(self, pixmap, pixel_spacing=None, slice_index=0, hu_grid=None, overlay_data=None, aspect_ratio=1.0,
+                   image_size=None, source_rect=None, hu_sampler=None):
         self.pixmap = pixmap
         self.pixel_spacing = pixel_spacing
         self.current_slice_index = slice_index
         self.hu_grid = hu_grid
+        self.image_size = image_size
+        self.source_rect = source_rect
+        self.hu_sampler = hu_sampler
         if overlay_data: self.overlay_data = overlay_data
         self.target_aspect_ratio = aspect_ratio
         self.update()
@@ -84,14 +93,32 @@ class ImageCanvas(QWidget):
             self.probe_pos = pos
             self.update()
 
+    def image_width(self):
+        if self.image_size is not None: return self.image_size[0]
+        return self.pixmap.width() if self.pixmap is not None else 0
+
+    def image_height(self):
+        if self.image_size is not None: return self.image_size[1]
+        return self.pixmap.height() if self.pixmap is not None else 0
+
+    def get_hu_block(self, x0, y0, x1, y1):
+        """論理画像座標 [x0, x1) x [y0, y1) のCT値 (画像外は切り詰め) / 無ければ None"""
+        x0 = max(0, x0); y0 = max(0, y0)
+        x1 = min(self.image_width(), x1); y1 = min(self.image_height(), y1)
+        if x0 >= x1 or y0 >= y1: return None
+        if self.hu_sampler is not None: return self.hu_sampler(x0, y0, x1, y1)
+        if self.hu_grid is None: return None
+        return self.hu_grid[y0:y1, x0:x1]
+
     def get_scale_and_offset(self):
-        if self.pixmap is None: return 1.0, 0, 0
+        if self.pixmap is None and self.image_size is None: return 1.0, 0, 0
         if math.isnan(self.zoom_factor) or math.isinf(self.zoom_factor) or self.zoom_factor <= 0.001: self.zoom_factor = 1.0
         if math.isnan(self.pan_x) or math.isinf(self.pan_x): self.pan_x = 0
         if math.isnan(self.pan_y) or math.isinf(self.pan_y): self.pan_y = 0
         
         win_w, win_h = self.width(), self.height()
-        img_w, img_h = self.pixmap.width(), self.pixmap.height()
+        img_w, img_h = self.image_width(), self.image_height()
+        if img_w <= 0 or img_h <= 0: return 1.0, 0, 0
         display_h = img_h * self.target_aspect_ratio
         if display_h == 0: display_h = 1
         
@@ -135,14 +162,19 @@ class ImageCanvas(QWidget):
         scale, off_x, off_y = self.get_scale_and_offset()
         if scale <= 0.001: return
 
-        img_w = self.pixmap.width()
-        img_h = self.pixmap.height()
-        draw_w = img_w * scale
-        draw_h = (img_h * self.target_aspect_ratio) * scale
-        target_rect = QRectF(off_x, off_y, draw_w, draw_h)
-        
         painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, True)
-        painter.drawPixmap(target_rect.toRect(), self.pixmap)
+        if self.source_rect is not None:
+            # 論理画像の一部だけを描画した pixmap は、その範囲の位置に貼る
+            if not self.source_rect.isEmpty():
+                target_rect = QRectF(self.image_to_screen(self.source_rect.topLeft()), self.image_to_screen(self.source_rect.bottomRight()))
+                painter.drawPixmap(target_rect, self.pixmap, QRectF(self.pixmap.rect()))
+        else:
+            img_w = self.pixmap.width()
+            img_h = self.pixmap.height()
+            draw_w = img_w * scale
+            draw_h = (img_h * self.target_aspect_ratio) * scale
+            target_rect = QRectF(off_x, off_y, draw_w, draw_h)
+            painter.drawPixmap(target_rect.toRect(), self.pixmap)
 
         self.draw_cross_refs(painter)
         self.draw_overlays(painter)
@@ -179,7 +211,8 @@ class ImageCanvas(QWidget):
             elif self.current_mode == 'roi':
                 rect_img = QRectF(self.current_drawing_start, self.current_drawing_end).normalized()
                 rect_scr = QRectF(p1, p2).normalized()
-                stats = self.calculate_roi_stats(rect_img)
+                # ドラッグ中は表示中のフレームから概算する (MPRで毎回サンプリングし直さない)
+                stats = self.calculate_roi_stats(rect_img, preview=True)
                 if stats != "N/A":
                     mean, std, mx, mn, area = stats
                     text = f"Mean:{mean:.1f} SD:{std:.1f}\nMax:{mx:.0f} Min:{mn:.0f}\nArea:{area:.0f}mm2"
@@ -193,10 +226,10 @@ class ImageCanvas(QWidget):
         img_pt = self.screen_to_image(self.probe_pos)
         if not img_pt: return
         ix, iy = int(img_pt.x()), int(img_pt.y())
-        if self.hu_grid is not None:
-            h, w = self.hu_grid.shape
-            if 0 <= ix < w and 0 <= iy < h:
-                val = self.hu_grid[iy, ix]
+        if self.hu_grid is not None or self.hu_sampler is not None:
+            block = self.get_hu_block(ix, iy, ix + 1, iy + 1)
+            if block is not None:
+                val = block[0, 0]
                 text = f"HU: {int(val)}"
                 x = self.probe_pos.x() + 15
                 y = self.probe_pos.y() + 25
@@ -241,11 +274,11 @@ class ImageCanvas(QWidget):
                 pos_img = line['pos']
                 if line['type'] == 'V':
                     p_top = self.image_to_screen(QPointF(pos_img, 0))
-                    p_bottom = self.image_to_screen(QPointF(pos_img, self.pixmap.height()))
+                    p_bottom = self.image_to_screen(QPointF(pos_img, self.image_height()))
                     painter.drawLine(int(p_top.x()), 0, int(p_bottom.x()), self.height())
                 elif line['type'] == 'H':
                     p_left = self.image_to_screen(QPointF(0, pos_img))
-                    p_right = self.image_to_screen(QPointF(self.pixmap.width(), pos_img))
+                    p_right = self.image_to_screen(QPointF(self.image_width(), pos_img))
                     painter.drawLine(0, int(p_left.y()), self.width(), int(p_right.y()))
                     
         painter.setRenderHint(QPainter.RenderHint.Antialiasing, False)
@@ -376,15 +409,21 @@ class ImageCanvas(QWidget):
                 self.rois.pop(self.selected_index); self.selected_index = None; self.selected_type = None; self.update(); return True
         return False
 
-    def calculate_roi_stats(self, rect):
-        if self.hu_grid is None: return "N/A"
-        h, w = self.hu_grid.shape
+    def calculate_roi_stats(self, rect, preview=False):
+        """
+        :param preview: ドラッグ中の表示用。論理画像の一部を画面解像度で描画している場合 (MPR) は、
+                        論理解像度でサンプリングし直さず、表示中のフレームのCT値から概算する
+        """
+        if preview and self.source_rect is not None: return self._roi_stats_from_frame(rect)
+        if self.hu_grid is None and self.hu_sampler is None: return "N/A"
+        h, w = self.image_height(), self.image_width()
         norm_rect = rect.normalized()
         x = int(norm_rect.x()); y = int(norm_rect.y()); rw = int(norm_rect.width()); rh = int(norm_rect.height())
         if rw <= 0 or rh <= 0: return "N/A"
         x_start = max(0, x); y_start = max(0, y); x_end = min(w, x + rw + 1); y_end = min(h, y + rh + 1)
         if x_start >= x_end or y_start >= y_end: return "N/A"
-        sub_img = self.hu_grid[y_start:y_end, x_start:x_end]
+        sub_img = self.get_hu_block(x_start, y_start, x_end, y_end)
+        if sub_img is None: return "N/A"
         cx = x + rw / 2.0; cy = y + rh / 2.0; rx = rw / 2.0; ry = rh / 2.0
         y_idx, x_idx = np.ogrid[y_start:y_end, x_start:x_end]
         if rx == 0 or ry == 0: return "N/A"
@@ -394,4 +433,30 @@ class ImageCanvas(QWidget):
         mean_val = np.mean(roi_values); std_val = np.std(roi_values); max_val = np.max(roi_values); min_val = np.min(roi_values)
         if self.pixel_spacing: pixel_area = self.pixel_spacing[0] * self.pixel_spacing[1]; area_mm2 = len(roi_values) * pixel_area
         else: area_mm2 = len(roi_values) 
-        return mean_val, std_val, max_val, min_val, area_mm2
\ No newline at end of file
+        return mean_val, std_val, max_val, min_val, area_mm2
+
+    def _roi_stats_from_frame(self, rect):
+        """表示中のフレーム (hu_grid が source_rect を覆う) の画素で ROI の統計を求める"""
+        grid = self.hu_grid; src = self.source_rect
+        if grid is None or src.isEmpty(): return "N/A"
+        norm_rect = rect.normalized()
+        x = int(norm_rect.x()); y = int(norm_rect.y()); rw = int(norm_rect.width()); rh = int(norm_rect.height())
+        if rw <= 0 or rh <= 0: return "N/A"
+        cx = x + rw / 2.0; cy = y + rh / 2.0; rx = rw / 2.0; ry = rh / 2.0
+        gh, gw = grid.shape
+        step_x = src.width() / gw; step_y = src.height() / gh
+        # 表示画素の中心の論理画像座標 (calculate_roi_stats と同じく、論理画素 k の中心を k とする)
+        xs = src.x() + (np.arange(gw) + 0.5) * step_x - 0.5
+        ys = src.y() + (np.arange(gh) + 0.5) * step_y - 0.5
+        # 楕円の外接矩形に入る表示画素だけを見る
+        i0 = int(np.searchsorted(xs, cx - rx, side='left')); i1 = int(np.searchsorted(xs, cx + rx, side='right'))
+        j0 = int(np.searchsorted(ys, cy - ry, side='left')); j1 = int(np.searchsorted(ys, cy + ry, side='right'))
+        if i0 >= i1 or j0 >= j1: return "N/A"
+        mask = ((xs[np.newaxis, i0:i1] - cx)**2 / rx**2) + ((ys[j0:j1, np.newaxis] - cy)**2 / ry**2) <= 1.0
+        roi_values = grid[j0:j1, i0:i1][mask]
+        if len(roi_values) == 0: return "N/A"
+        mean_val = np.mean(roi_values); std_val = np.std(roi_values); max_val = np.max(roi_values); min_val = np.min(roi_values)
+        # 表示画素1つが覆う論理画素の数で面積を換算する
+        pixel_area = self.pixel_spacing[0] * self.pixel_spacing[1] if self.pixel_spacing else 1.0
+        area_mm2 = len(roi_values) * step_x * step_y * pixel_area
+        return mean_val, std_val, max_val, min_val, area_mm2
@@ -36,7 +36,9 @@ class ZetaViewer(QMainWindow):
         self.all_series_data = {} 
         self.viewports = [] 
         self.selected_viewports = set()
+        self.series_items = {}
         self.scan_worker = None
+        self._retired_scan_workers = []
         self.setup_ui()
         self.apply_styles()
         self.update_grid_layout(1, 1)
@@ -207,8 +209,9 @@ class ZetaViewer(QMainWindow):
             vp.pitch_angle    = new_pitch
             vp.roll_angle     = new_roll
             
-            # 自分以外は再描画を行う
+            # 自分以外は再描画を行う (描画は各ビューポートの描画スレッドで並列に行われる)
             if vp != sender:
+                vp.begin_interaction()
                 vp.update_display(emit_position=False)
         
         # 3. 最後にリファレンス線（十字線）を一括更新
@@ -314,8 +317,8 @@ class ZetaViewer(QMainWindow):
     def on_viewport_series_dropped(self, target_viewport, uid):
         self.select_single_viewport(target_viewport)
         if uid in self.all_series_data:
-            files = self.all_series_data[uid]['files']
-            target_viewport.load_series(files)
+            files = list(self.all_series_data[uid]['files'])
+            target_viewport.load_series(files, uid)
     def set_mode(self, mode):
         if mode == 0: self.mode_label.setText("CONTROLLER MODE (NAV)"); self.mode_label.setStyleSheet("color: #00FF00;")
         elif mode == 1: self.mode_label.setText("CONTROLLER MODE (RULER)"); self.mode_label.setStyleSheet("color: #FFFF00;")
@@ -340,21 +343,50 @@ class ZetaViewer(QMainWindow):
         folder_path = QFileDialog.getExistingDirectory(self, "Select DICOM Folder")
         if folder_path: self.start_folder_scan(folder_path)
     def start_folder_scan(self, folder_path):
+        # 前回のスキャンが走っていれば結果を受け取らないようにして止める
+        if self.scan_worker is not None:
+            for sig in (self.scan_worker.partial, self.scan_worker.finished, self.scan_worker.error):
+                try: sig.disconnect()
+                except TypeError: pass
+            self.scan_worker.requestInterruption()
+            # 実行中の QThread が GC されないよう、終了するまで参照を保持
+            self._retired_scan_workers = [w for w in self._retired_scan_workers if w.isRunning()]
+            self._retired_scan_workers.append(self.scan_worker)
+        self.all_series_data = {}; self.series_items = {}
         self.series_list_widget.clear(); self.series_list_widget.addItem("Scanning...")
         self.scan_worker = DicomScanWorker(folder_path)
+        self.scan_worker.partial.connect(self.on_scan_partial)
         self.scan_worker.finished.connect(self.on_scan_finished)
         self.scan_worker.error.connect(self.on_worker_error)
         self.scan_worker.start()
-    def on_scan_finished(self, series_info, message):
-        self.all_series_data = series_info; self.series_list_widget.clear()
-        for uid, info in series_info.items():
-            count = len(info['files'])
-            item = QListWidgetItem(f"[{info['modality']}] {info['desc']} ({count})")
+    def on_scan_partial(self, delta):
+        # スキャン途中でもシリーズをリストに出し、ドラッグできるようにする
+        if not self.series_items: self.series_list_widget.clear()
+        for uid, info in delta.items():
+            if uid not in self.all_series_data:
+                self.all_series_data[uid] = {'desc': info['desc'], 'modality': info['modality'], 'files': []}
+            self.all_series_data[uid]['files'].extend(info['files'])
+            self._update_series_item(uid)
+    def _update_series_item(self, uid):
+        info = self.all_series_data[uid]
+        text = f"[{info['modality']}] {info['desc']} ({len(info['files'])})"
+        item = self.series_items.get(uid)
+        if item is None:
+            item = QListWidgetItem(text)
             item.setData(Qt.ItemDataRole.UserRole, uid); self.series_list_widget.addItem(item)
+            self.series_items[uid] = item
+        else: item.setText(text)
+    def on_scan_finished(self, series_info, message):
+        # 確定した結果で並べ直す (選択中のシリーズは維持)
+        current = self.series_list_widget.currentItem()
+        current_uid = current.data(Qt.ItemDataRole.UserRole) if current else None
+        self.all_series_data = series_info; self.series_items = {}; self.series_list_widget.clear()
+        for uid in series_info: self._update_series_item(uid)
+        if current_uid in self.series_items: self.series_list_widget.setCurrentItem(self.series_items[current_uid])
     def on_series_clicked(self, item):
         if not self.selected_viewports: QMessageBox.warning(self, "Info", "No viewport selected."); return
         uid = item.data(Qt.ItemDataRole.UserRole)
         if uid in self.all_series_data:
-            files = self.all_series_data[uid]['files']
-            for vp in self.selected_viewports: vp.load_series(files)
+            files = list(self.all_series_data[uid]['files'])
+            for vp in self.selected_viewports: vp.load_series(files, uid)
     def on_worker_error(self, message): QMessageBox.warning(self, "Error", message)
\ No newline at end of file
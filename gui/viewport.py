@@ -1,12 +1,17 @@
 import numpy as np
 import pydicom
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QFrame, QMenu
-from PyQt6.QtCore import Qt, pyqtSignal, QRectF, QPointF
+from PyQt6.QtCore import Qt, pyqtSignal, QRectF, QPointF, QTimer
 from PyQt6.QtGui import QImage, QPixmap, QColor, QPalette, QAction, QCursor
 from gui.canvas import ImageCanvas
-from core.loader import SeriesLoadWorker, MprBuilderWorker
+from core.series_cache import SeriesCache, make_series_key
 from gui.tag_window import DicomTagWindow
 from core.mpr_logic import get_resampled_slice, get_rotation_matrix
+from core.windowing import apply_window
+from core.render_queue import RenderQueue
+from core.slab_cache import SlabCache
+from core.frame_cache import FrameCache
+from core.volume import VolumeStats, get_pyramid
 
 class ZetaViewport(QFrame):
     activated = pyqtSignal(object, object)
@@ -25,18 +30,32 @@ class ZetaViewport(QFrame):
 
     rotation_changed = pyqtSignal(object, float)
 
+    # --- 操作中の簡易描画 (MPR) ---
+    INTERACTIVE_SCALE = 0.5         # 操作中の描画解像度 (画面解像度に対する比)
+    INTERACTIVE_SLAB_SAMPLES = 4    # 操作中のスラブ厚方向サンプル数の上限
+    REFINE_DELAY_MS = 150           # 操作が止まってから高画質で描き直すまでの時間
+    REFINE_ORDER = 1                # 高画質描画の補間次数 (3 でキュービック)
+
+    # --- 2D表示の先読み ---
+    PREFETCH_AHEAD = 24             # スクロール方向に先読みする枚数
+    PREFETCH_BEHIND = 4             # 逆方向に先読みする枚数
+
     def __init__(self, parent=None):
         super().__init__(parent)
         
         # 1. まず変数を初期化する (これを先に持ってくる)
         self.is_mpr_enabled = False 
         self.volume_data = None
+        self.volume_stats = None  # ボリューム構築時に計算した統計 (最小値・ヒストグラム)
+        self._volume_min = None   # 範囲外の塗りつぶし値 (ボリュームの最小値)
+        self.volume_grid = None   # VolumeGrid (切り出し・斜めの撮影の配列とMPRの座標系の対応) / 配列がそのまま格子なら None
         self.rotation_angle = 0.0
         self.pitch_angle = 0.0  
         self.roll_angle = 0.0
         self.view_plane = 'Axial'
-        self.current_slices = []
+        self.current_series = None   # CompactSeries (画素配列 + 最小限のメタデータ)
         self.current_file_paths = []
+        self.series_key = None
         self.voxel_spacing = (1.0, 1.0, 1.0)
         self.mpr_loaded = False
         self.current_index = 0
@@ -46,11 +65,26 @@ class ZetaViewport(QFrame):
         self.window_level = 40
         self.window_width = 400
         self.current_tool_mode = 0 
-        self._img_buffer = None
+        self._last_frame = None   # 直近のCT値画像 (W/Lだけが変わった時に再利用する)
+        # 描画は別スレッドで行い、結果だけをGUIスレッドで受け取る (古い要求は捨てる)
+        self._render_queue = RenderQueue()
+        self._render_queue.frame_ready.connect(self._on_frame_ready)
+        self._shown_seq = 0
+        self._slab_cache = None   # 厚いスラブのページング用 (描画スレッドだけが使う)
+        # 2D表示: ウィンドウ処理済みのフレームを保持し、スクロール方向の前後を別キューで先読みする
+        self._frame_cache = FrameCache()
+        self._prefetch_queue = RenderQueue()
+        self._prefetch_gen = 0    # 先読みの世代 (新しい先読みを出したら古い先読みは途中でやめる)
+        self._scroll_dir = 1
+        self._interactive = False
+        self._refine_timer = QTimer(self); self._refine_timer.setSingleShot(True)
+        self._refine_timer.setInterval(self.REFINE_DELAY_MS)
+        self._refine_timer.timeout.connect(self._refine)
         self._cached_wl = 40
         self._cached_ww = 400
-        self.load_worker = None
-        self.mpr_worker = None
+        # 読み込み・MPR構築は全ビューポート共通のキャッシュ経由で行う
+        self.series_cache = SeriesCache.instance()
+        self._waiting_series = False; self._waiting_volume = False
         self.last_mouse_pos = None
         self.drag_accumulator = 0
         self.is_right_dragged = False
@@ -74,6 +108,11 @@ class ZetaViewport(QFrame):
         self.canvas = ImageCanvas()
         self.layout.addWidget(self.canvas)
         
+        self.series_cache.series_ready.connect(self.on_cache_series_ready)
+        self.series_cache.series_progress.connect(self.on_cache_series_progress)
+        self.series_cache.volume_ready.connect(self.on_cache_volume_ready)
+        self.series_cache.volume_progress.connect(self.on_cache_volume_progress)
+
         # 4. 最後に set_active を呼ぶ (これで update_border が動いても大丈夫)
         self.set_active(False)
 
@@ -127,9 +166,14 @@ class ZetaViewport(QFrame):
         try: return float(val)
         except: return default
 
+    def grid_shape(self):
+        """MPRの座標系の格子の (Z, Y, X) (切り出したボリュームでも元の大きさ)"""
+        if self.volume_grid is not None: return self.volume_grid.shape
+        return self.volume_data.shape
+
     def get_current_coordinates(self):
         if self.volume_data is None: return 0, 0, 0
-        vc = self.volume_data.shape # (Z, Y, X)
+        vc = self.grid_shape() # (Z, Y, X)
         cx, cy, cz = vc[2]//2, vc[1]//2, vc[0]//2
         if self.view_plane == 'Axial': cz = self.current_index
         elif self.view_plane == 'Coronal': cy = self.current_index
@@ -148,11 +192,12 @@ class ZetaViewport(QFrame):
 
         cx, cy, cz = sender_vp.get_current_coordinates()
         
-        if self.canvas.pixmap is None: return
-        img_w = self.canvas.pixmap.width(); img_h = self.canvas.pixmap.height()
+        # 描画が非同期なので、pixmap の到着を待たずに論理画像のサイズで判定する
+        if self.canvas.image_width() <= 0: return
+        img_w = self.canvas.image_width(); img_h = self.canvas.image_height()
         screen_center_x = img_w / 2; screen_center_y = img_h / 2
         
-        vc = self.volume_data.shape
+        vc = self.grid_shape()
         vol_center_x = vc[2] // 2; vol_center_y = vc[1] // 2; vol_center_z = vc[0] // 2
         
         sp_z, sp_y, sp_x = self.voxel_spacing
@@ -216,7 +261,7 @@ class ZetaViewport(QFrame):
     # --- 位置情報発信 ---
     def notify_position_change(self):
         if not self.is_mpr_enabled or self.volume_data is None: return
-        vc = self.volume_data.shape
+        vc = self.grid_shape()
         cx, cy, cz = vc[2]//2, vc[1]//2, vc[0]//2
         if self.view_plane == 'Axial': cz = self.current_index
         elif self.view_plane == 'Coronal': cy = self.current_index
@@ -228,14 +273,16 @@ class ZetaViewport(QFrame):
         if self.is_mpr_enabled and self.volume_data is not None:
             self._render_mpr()
             if emit_position: self.notify_position_change()
-        elif self.current_slices:
+        elif self.current_series:
             self._render_2d()
 
     def scroll_step(self, steps, emit_sync=True):
         max_idx = self.get_max_index()
         new_index = int(np.clip(self.current_index + steps, 0, max_idx))
         if new_index != self.current_index:
+            self._scroll_dir = 1 if new_index > self.current_index else -1
             self.current_index = new_index
+            self.begin_interaction()
             self.update_display(emit_position=emit_sync)
             if emit_sync: self.scrolled.emit(self, steps)
 
@@ -243,27 +290,57 @@ class ZetaViewport(QFrame):
         if abs(dx)>1000 or abs(dy)>1000: return
         self.canvas.pan_x += dx
         self.canvas.pan_y += dy
-        self.canvas.update()
+        self.begin_interaction()
+        self._refresh_view()
 
     def apply_wl(self, dw, dl):
         if abs(dw)>10000 or abs(dl)>10000: return
         self.window_width = max(1, self.window_width + dw)
         self.window_level += dl
-        self.update_display()
+        # 画像は変わらないので、ウィンドウ処理だけやり直す
+        if self._last_frame is not None: self._process_and_send_image(*self._last_frame[:3], **self._last_frame[3])
+        else: self.update_display()
 
     def apply_zoom(self, delta_factor):
         if hasattr(self.canvas, 'zoom_factor'):
             new_zoom = self.canvas.zoom_factor + delta_factor
             self.canvas.zoom_factor = max(0.1, min(10.0, new_zoom))
-            self.canvas.update()
+            self.begin_interaction()
+            self._refresh_view()
+
+    def begin_interaction(self):
+        """
+        操作中 (ページング・パン・ズーム・断面回転) は MPR を低解像度・最近傍補間・少ないスラブ数で描画し、
+        操作が止まったら高画質で描き直す
+        """
+        if not (self.is_mpr_enabled and self.volume_data is not None): return
+        self._interactive = True
+        self._refine_timer.start()
+
+    def _refine(self):
+        if not self._interactive: return
+        self._interactive = False
+        self.update_display(emit_position=False)
+
+    def _refresh_view(self):
+        # MPRは見えている範囲だけを描画しているので、パン・ズームで描画し直す
+        if self.is_mpr_enabled and self.volume_data is not None: self.update_display(emit_position=False)
+        else: self.canvas.update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.is_mpr_enabled and self.volume_data is not None: self.update_display(emit_position=False)
 
     # --- 状態保存・復元 ---
     def get_state(self):
         return {
             'file_paths': self.current_file_paths,
-            'slices': self.current_slices,
+            'series_key': self.series_key,
+            'series': self.current_series,
             'volume': self.volume_data,
             'spacing': self.voxel_spacing,
+            'volume_stats': self.volume_stats,
+            'volume_grid': self.volume_grid,
             'mpr_loaded': self.mpr_loaded,
             'index': self.current_index,
             'plane': self.view_plane,
@@ -285,9 +362,12 @@ class ZetaViewport(QFrame):
     def restore_state(self, state):
         if not state.get('file_paths'): return
         self.current_file_paths = state['file_paths']
-        self.current_slices = state['slices']
-        self.volume_data = state['volume']
+        self.series_key = state.get('series_key') or make_series_key(None, self.current_file_paths)
+        self.current_series = state.get('series')
+        self.volume_data = state['volume']; self._volume_min = None; self._last_frame = None; self._cancel_render()
         self.voxel_spacing = state['spacing']
+        self.volume_stats = state.get('volume_stats')
+        self.volume_grid = state.get('volume_grid')
         self.mpr_loaded = state['mpr_loaded']
         self.current_index = state['index']
         self.view_plane = state['plane']
@@ -304,6 +384,15 @@ class ZetaViewport(QFrame):
         self.canvas.measurements = state['measurements']
         self.canvas.rois = state['rois']
         self.current_tool_mode = state['tool_mode']
+        # 読み込み途中でレイアウトが変わった場合は、キャッシュの読み込みに合流し直す
+        if self.current_series is None:
+            cached = self.series_cache.request_series(self.series_key, self.current_file_paths, self)
+            if cached is not None: self.current_series = cached
+            else: self._waiting_series = True
+        if self.is_mpr_enabled and not self.mpr_loaded:
+            cached = self.series_cache.request_volume(self.series_key, self.current_file_paths, self)
+            if cached is not None: self.volume_data, self.voxel_spacing, self.volume_stats, self.volume_grid = cached; self.mpr_loaded = True
+            else: self._waiting_volume = True
         self.update_display(emit_position=False)
 
     def set_mip_params(self, mode, thickness_mm):
@@ -315,7 +404,7 @@ class ZetaViewport(QFrame):
     # --- MPR描画 ---
     def _render_mpr(self):
         if self.volume_data is None: return
-        vc = self.volume_data.shape
+        vc = self.grid_shape()
         center_x = vc[2] // 2; center_y = vc[1] // 2; center_z = vc[0] // 2
         
         if self.view_plane == 'Axial': center_z = self.current_index
@@ -363,22 +452,72 @@ class ZetaViewport(QFrame):
             vec_down_final   = vec_down_rot   * spacing_scale
             vec_normal_final = vec_normal_rot * spacing_scale
 
+            # 論理画像 (計測・ROI・リファレンス線の座標系) は従来通り max(dim)*1.2 の正方形
             dim = max(vc)
             req_w = int(dim * 1.2); req_h = int(dim * 1.2)
-            
-            slice_img = get_resampled_slice(
-                self.volume_data, center_point,
-                vec_right_final, vec_down_final, vec_normal_final,
-                req_w, req_h, self.voxel_spacing,
-                self.slab_thickness_mm, self.mip_mode
-            )
-            
-            ds = self.current_slices[0] if self.current_slices else None
-            hu_image = slice_img.astype(np.float32)
-            self._process_and_send_image(hu_image, 1.0, ds)
+            if self._volume_min is None:
+                # ボリュームが変わった (初回描画): 前のボリュームの層は使えないのでキャッシュも作り直す
+                if self.volume_stats is not None: self._volume_min = self.volume_stats.minimum
+                else: self._volume_min = float(np.min(self.volume_data))
+                self._slab_cache = SlabCache()
+            # 描画スレッドに渡すので、この時点の状態を固定しておく
+            # (切り出し・斜めの撮影のボリュームは volume_grid で配列の添字に直して読む)
+            params = dict(volume=self.volume_data, spacing=self.voxel_spacing, image_size=(req_w, req_h),
+                          geometry=(center_point, vec_right_final, vec_down_final, vec_normal_final),
+                          thickness_mm=self.slab_thickness_mm, mode=self.mip_mode, cval=self._volume_min, stats=self.volume_stats,
+                          grid=self.volume_grid)
+
+            # そのうち画面に見えている範囲だけを、画面の解像度でサンプリングする
+            ds = self.current_series.meta if self.current_series else None
+            view_rect, out_size = self._mpr_view_rect(req_w, req_h)
+            if view_rect is None:
+                # 画像が完全に画面外 (パンしすぎ) の場合は描画しない
+                cval = self._volume_min
+                compute_hu = lambda: np.full((1, 1), cval, dtype=np.float32); source_rect = QRectF()
+            else:
+                x0, y0, x1, y1 = view_rect; out_w, out_h = out_size
+                step_x = (x1 - x0) / out_w; step_y = (y1 - y0) / out_h
+                # 出力画素の中心が論理画素のどこに当たるか (論理画素 i の中心 = 座標 i + 0.5)
+                if self._interactive: quality = dict(order=0, max_depth=self.INTERACTIVE_SLAB_SAMPLES)
+                else: quality = dict(order=self.REFINE_ORDER)
+                sx0 = x0 + 0.5 * step_x - 0.5; sy0 = y0 + 0.5 * step_y - 0.5
+                # スラブのページングは前のフレームの層を使い回す (プローブ用の hu_sampler はGUIスレッドなので使わない)
+                slab_cache = self._slab_cache if self.slab_thickness_mm > 0 else None
+                # 縮小表示では縮小段から読む。平均で縮小した段では細い高信号・低信号が薄まるので、
+                # MIP/MinIP スラブの高画質描画では使わない (プローブも常に元の解像度)
+                pyramid = get_pyramid(self.volume_data)
+                if not self._interactive and self.slab_thickness_mm > 0 and self.mip_mode in ('MIP', 'MinIP'): pyramid = None
+                compute_hu = lambda: _sample_mpr(params, sx0, sy0, out_w, out_h, (step_x, step_y),
+                                                 slab_cache=slab_cache, pyramid=pyramid, **quality)
+                source_rect = QRectF(x0, y0, x1 - x0, y1 - y0)
+
+            # プローブ・ROIは論理解像度でサンプリングし直すので、表示解像度に依らず値が変わらない
+            def hu_sampler(sx0, sy0, sx1, sy1):
+                return _sample_mpr(params, sx0, sy0, sx1 - sx0, sy1 - sy0)
+
+            self._submit_frame(compute_hu, 1.0, ds, image_size=(req_w, req_h),
+                               source_rect=source_rect, hu_sampler=hu_sampler)
         except Exception as e:
             print(f"MPR Render Error: {e}")
 
+    def _mpr_view_rect(self, img_w, img_h):
+        """
+        論理画像のうち画面に見えている範囲 (x0, y0, x1, y1) と、描画する画素数 (out_w, out_h)
+        キャンバスのサイズが未確定なら全体を等倍で返す / 完全に画面外なら (None, None)
+        """
+        self.canvas.image_size = (img_w, img_h)
+        scale, off_x, off_y = self.canvas.get_scale_and_offset()
+        cw, ch = self.canvas.width(), self.canvas.height()
+        if scale <= 0.001 or cw <= 0 or ch <= 0: return (0, 0, img_w, img_h), (img_w, img_h)
+        x0 = max(0.0, -off_x / scale); x1 = min(float(img_w), (cw - off_x) / scale)
+        y0 = max(0.0, -off_y / scale); y1 = min(float(img_h), (ch - off_y) / scale)
+        if x1 <= x0 or y1 <= y0: return None, None
+        dpr = self.canvas.devicePixelRatioF()
+        if self._interactive: dpr *= self.INTERACTIVE_SCALE
+        out_w = max(1, int(np.ceil((x1 - x0) * scale * dpr)))
+        out_h = max(1, int(np.ceil((y1 - y0) * scale * dpr)))
+        return (x0, y0, x1, y1), (out_w, out_h)
+
     def _project_slab(self, slab, axis):
         if slab.shape[axis] == 0: return np.zeros((1,1), dtype=np.float32)
         if slab.shape[axis] == 1: 
@@ -450,24 +589,24 @@ class ZetaViewport(QFrame):
             self._cached_wl = self.window_level; self._cached_ww = self.window_width
             if not self.mpr_loaded and self.current_file_paths:
                 self.processing_start.emit("Building 3D MPR...")
-                self.mpr_worker = MprBuilderWorker(self.current_file_paths)
-                self.mpr_worker.progress.connect(self.processing_progress)
-                self.mpr_worker.finished.connect(self.on_mpr_finished)
-                self.mpr_worker.start()
+                cached = self.series_cache.request_volume(self.series_key, self.current_file_paths, self)
+                if cached is not None: self.on_mpr_finished(*cached)
+                else: self._waiting_volume = True
             else:
                 self.set_view_plane('Axial')
                 self.window_level = self._cached_wl; self.window_width = self._cached_ww
                 self.update_display(emit_position=True)
         else:
             self.view_plane = 'Axial'
-            self.current_index = min(self.current_index, len(self.current_slices)-1)
+            self.current_index = min(self.current_index, self.get_max_index())
             self.update_display(emit_position=False)
 
-    def on_mpr_finished(self, volume, spacing):
+    def on_mpr_finished(self, volume, spacing, stats=None, grid=None):
         self.processing_finish.emit() 
         if volume is None:
             self.canvas.overlay_data['BL'] = ["MPR Error"]; self.canvas.update(); return
-        self.volume_data = volume; self.voxel_spacing = spacing; self.mpr_loaded = True
+        self.volume_data = volume; self.voxel_spacing = spacing; self.mpr_loaded = True; self._volume_min = None
+        self.volume_stats = stats; self.volume_grid = grid
         self.set_view_plane('Axial')
         self.window_level = self._cached_wl; self.window_width = self._cached_ww
         self.update_display(emit_position=True)
@@ -481,18 +620,45 @@ class ZetaViewport(QFrame):
         self.canvas.reset_view(); self.update_display()
         self.update_border()
 
-    def load_series(self, file_paths):
-        self.current_file_paths = file_paths; self.mpr_loaded = False; self.volume_data = None; self.is_mpr_enabled = False 
+    def load_series(self, file_paths, series_uid=None):
+        # 前のシリーズの待機を取り消す (他に誰も待っていなければ読み込みはキャンセルされる)
+        self.series_cache.release(self)
+        if self._waiting_volume: self.processing_finish.emit()
+        self._waiting_series = False; self._waiting_volume = False
+        self.current_file_paths = file_paths; self.mpr_loaded = False; self.volume_data = None; self.is_mpr_enabled = False; self._volume_min = None
+        self.volume_stats = None; self.volume_grid = None
+        self.series_key = make_series_key(series_uid, file_paths)
+        self._last_frame = None; self._cancel_render()
         self.canvas.overlay_data['BL'] = ["LOADING..."]; self.canvas.update()
-        if self.load_worker and self.load_worker.isRunning(): self.load_worker.terminate()
-        self.load_worker = SeriesLoadWorker(file_paths)
-        self.load_worker.finished.connect(self.on_load_finished)
-        self.load_worker.start()
-
-    def on_load_finished(self, slices, pixel_spacing):
-        self.current_slices = slices; self.current_index = 0; self.canvas.reset_view(); self.canvas.pixel_spacing = pixel_spacing
-        if slices:
-            ds = slices[0]
+        cached = self.series_cache.request_series(self.series_key, file_paths, self)
+        if cached is not None: self.on_load_finished(cached)
+        else: self._waiting_series = True
+
+    def on_cache_series_ready(self, key, series):
+        if not self._waiting_series or key != self.series_key: return
+        self._waiting_series = False
+        self.on_load_finished(series)
+
+    def on_cache_volume_ready(self, key, volume, spacing, stats, grid):
+        if not self._waiting_volume or key != self.series_key: return
+        self._waiting_volume = False
+        self.on_mpr_finished(volume, spacing, stats, grid)
+
+    def on_cache_series_progress(self, key, value):
+        if self._waiting_series and key == self.series_key: self.on_load_progress(value)
+
+    def on_cache_volume_progress(self, key, value):
+        if self._waiting_volume and key == self.series_key: self.processing_progress.emit(value)
+
+    def on_load_progress(self, value):
+        self.canvas.overlay_data['BL'] = [f"LOADING... {value}%"]; self.canvas.update()
+
+    def on_load_finished(self, series):
+        self.current_series = series
+        self.current_index = 0; self.canvas.reset_view()
+        self.canvas.pixel_spacing = series.pixel_spacing if series else None
+        if series:
+            ds = series.meta
             self.window_level = self._get_safe_dicom_value(ds, 'WindowCenter', 40)
             self.window_width = self._get_safe_dicom_value(ds, 'WindowWidth', 400)
             if self.window_width <= 0: self.window_width = 100
@@ -503,38 +669,94 @@ class ZetaViewport(QFrame):
         if self.is_mpr_enabled and self.volume_data is not None:
             self._render_mpr()
             if emit_position: self.notify_position_change()
-        elif self.current_slices: self._render_2d()
+        elif self.current_series: self._render_2d()
 
     def _render_2d(self):
-        self.current_index = max(0, min(self.current_index, len(self.current_slices) - 1))
-        ds = self.current_slices[self.current_index]
-        try:
-            pixel_array = ds.pixel_array.astype(np.float32)
-            slope = getattr(ds, 'RescaleSlope', 1.0); intercept = getattr(ds, 'RescaleIntercept', 0.0)
-            hu_image = pixel_array * slope + intercept
-            self._process_and_send_image(hu_image, 1.0, ds)
-        except Exception as e: print(f"2D Error: {e}")
-
-    def _process_and_send_image(self, hu_image, aspect_ratio, ds_meta):
-        min_v = self.window_level - (self.window_width / 2.0); max_v = self.window_level + (self.window_width / 2.0)
-        img_windowed = np.clip(hu_image, min_v, max_v)
-        div = max_v - min_v; 
-        if div == 0: div = 1
-        img_norm = ((img_windowed - min_v) / div * 255).astype(np.uint8)
-        img_norm = np.ascontiguousarray(img_norm)
-        h, w = img_norm.shape
-        self._img_buffer = img_norm.tobytes()
-        q_img = QImage(self._img_buffer, w, h, w, QImage.Format.Format_Grayscale8).copy()
+        series = self.current_series
+        self.current_index = max(0, min(self.current_index, len(series) - 1))
+        index = self.current_index
+        # CT値画像は作らない: ウィンドウ処理は格納値から LUT で、プローブ・ROIのCT値は必要な範囲だけ計算する
+        hu_sampler = lambda x0, y0, x1, y1: series.get_hu_block(index, x0, y0, x1, y1)
+        window = lambda level, width: series.window_slice(index, level, width)
+        frame = self._frame_cache.get((id(series), index, self.window_level, self.window_width))
+        if frame is not None:
+            # 表示済み・先読み済みのスライスはそのまま表示する (描画中・送信済みの古い要求の結果は捨てる)
+            self._discard_rendered()
+            self._process_and_send_image(None, 1.0, series.meta, hu_sampler=hu_sampler, q_img=_to_qimage(frame), window=window)
+        else:
+            self._submit_frame(None, 1.0, series.meta, cache_key=(id(series), index), hu_sampler=hu_sampler, window=window)
+        self._prefetch_2d(series, index)
+
+    def _prefetch_2d(self, series, index):
+        """スクロール方向の前後のスライスを、描画スレッドでウィンドウ処理してフレームキャッシュに入れる"""
+        level, width = self.window_level, self.window_width
+        cache = self._frame_cache; d = self._scroll_dir
+        ids = [index + d * k for k in range(1, self.PREFETCH_AHEAD + 1)]
+        ids += [index - d * k for k in range(1, self.PREFETCH_BEHIND + 1)]
+        ids = [i for i in ids if 0 <= i < len(series)]
+        self._prefetch_gen += 1; gen = self._prefetch_gen
+        def job():
+            for i in ids:
+                if self._prefetch_gen != gen: return   # 次の先読みに置き換わった
+                key = (id(series), i, level, width)
+                if key not in cache: cache.put(key, series.window_slice(i, level, width))
+        if ids: self._prefetch_queue.submit(job)
+
+    def _submit_frame(self, compute_hu, aspect_ratio, ds_meta, cache_key=None, **canvas_kwargs):
+        """
+        compute_hu (CT値画像の計算) とウィンドウ処理を描画スレッドで行い、完成したら _on_frame_ready で表示する
+        compute_hu が None なら、canvas_kwargs の window(level, width) だけでウィンドウ処理する (2D表示)
+        cache_key (シリーズ, スライス番号) を渡すと、ウィンドウ処理した画像をフレームキャッシュに入れる
+        """
+        level, width = self.window_level, self.window_width
+        canvas_kwargs['index'] = self.current_index
+        cache = self._frame_cache; window = canvas_kwargs.get('window')
+        def job():
+            hu_image = compute_hu() if compute_hu is not None else None
+            img_u8 = window(level, width) if window is not None else apply_window(hu_image, level, width)
+            if cache_key is not None: cache.put(cache_key + (level, width), img_u8)
+            return hu_image, aspect_ratio, ds_meta, canvas_kwargs, _to_qimage(img_u8), (level, width)
+        self._render_queue.submit(job)
+
+    def _discard_rendered(self):
+        # 送信済みでまだ届いていない結果も _on_frame_ready で捨てるよう、表示済みの seq を進める
+        self._shown_seq = max(self._shown_seq, self._render_queue.cancel())
+
+    def _cancel_render(self):
+        # 前のシリーズの描画結果が後から届いても表示しない (先読みもやめて、フレームキャッシュも捨てる)
+        self._discard_rendered()
+        self._prefetch_gen += 1; self._prefetch_queue.cancel()
+        self._frame_cache.clear()
+
+    def _on_frame_ready(self, seq, frame):
+        # 表示済みより古いフレームは捨てる
+        if frame is None or seq <= self._shown_seq: return
+        self._shown_seq = seq
+        hu_image, aspect_ratio, ds_meta, canvas_kwargs, q_img, wl = frame
+        # 描画中に W/L が変わっていたら、GUIスレッドでウィンドウ処理だけやり直す
+        if wl != (self.window_level, self.window_width): q_img = None
+        self._process_and_send_image(hu_image, aspect_ratio, ds_meta, q_img=q_img, **canvas_kwargs)
+
+    def _process_and_send_image(self, hu_image, aspect_ratio, ds_meta, image_size=None, source_rect=None, hu_sampler=None,
+                                index=None, q_img=None, window=None):
+        if index is None: index = self.current_index
+        # window(level, width) -> 8bit / 無ければCT値画像からウィンドウ処理する (W/L変更時もこれでやり直す)
+        if window is None: window = lambda level, width: apply_window(hu_image, level, width)
+        self._last_frame = (hu_image, aspect_ratio, ds_meta,
+                            dict(image_size=image_size, source_rect=source_rect, hu_sampler=hu_sampler, index=index, window=window))
+        if q_img is None: q_img = _to_qimage(window(self.window_level, self.window_width))
         pixmap = QPixmap.fromImage(q_img)
         overlay_info = self.create_overlay_info(ds_meta)
-        self.canvas.set_pixmap(pixmap, self.canvas.pixel_spacing, self.current_index, hu_image, overlay_data=overlay_info, aspect_ratio=aspect_ratio)
+        self.canvas.set_pixmap(pixmap, self.canvas.pixel_spacing, index, hu_image, overlay_data=overlay_info, aspect_ratio=aspect_ratio,
+                               image_size=image_size, source_rect=source_rect, hu_sampler=hu_sampler)
 
     def get_max_index(self):
         if self.is_mpr_enabled and self.volume_data is not None:
-            if self.view_plane == 'Axial': return self.volume_data.shape[0] - 1
-            elif self.view_plane == 'Coronal': return self.volume_data.shape[1] - 1
-            elif self.view_plane == 'Sagittal': return self.volume_data.shape[2] - 1
-        elif self.current_slices: return len(self.current_slices) - 1
+            vc = self.grid_shape()
+            if self.view_plane == 'Axial': return vc[0] - 1
+            elif self.view_plane == 'Coronal': return vc[1] - 1
+            elif self.view_plane == 'Sagittal': return vc[2] - 1
+        elif self.current_series: return len(self.current_series) - 1
         return 0
 
     def show_context_menu(self, global_pos):
@@ -542,14 +764,34 @@ class ZetaViewport(QFrame):
         action_tags = QAction("Show DICOM Tags", self)
         action_tags.triggered.connect(self.open_dicom_tags)
         menu.addAction(action_tags)
+        action_auto_wl = QAction("Auto Window", self)
+        action_auto_wl.triggered.connect(self.auto_window)
+        action_auto_wl.setEnabled(self.volume_data is not None or self.current_series is not None)
+        menu.addAction(action_auto_wl)
         menu.exec(global_pos)
 
+    def auto_window(self):
+        """ヒストグラムの 1〜99 パーセンタイル (背景を除く) に W/L を合わせる"""
+        if self.is_mpr_enabled and self.volume_data is not None:
+            stats = self.volume_stats
+            # 統計が無い (古い状態の復元など) 場合だけ、その場で計算して持っておく
+            if stats is None: stats = self.volume_stats = VolumeStats.from_volume(self.volume_data)
+        elif self.current_series:
+            stats = VolumeStats.from_volume(self.current_series.get_hu_slice(self.current_index)[np.newaxis])
+        else: return
+        level, width = stats.auto_window()
+        dw = width - self.window_width; dl = level - self.window_level
+        self.apply_wl(dw, dl); self.wl_changed.emit(self, dw, dl)
+
     def open_dicom_tags(self):
         ds = None
-        if not self.is_mpr_enabled and self.current_slices:
-            idx = max(0, min(self.current_index, len(self.current_slices)-1))
-            ds = self.current_slices[idx]
-        elif self.is_mpr_enabled and self.current_slices: ds = self.current_slices[0]
+        series = self.current_series
+        # 全タグは保持していないので、表示時に元ファイルから読み直す
+        try:
+            if not self.is_mpr_enabled and series:
+                ds = series.load_dataset(max(0, min(self.current_index, len(series)-1)))
+            elif self.is_mpr_enabled and series: ds = series.load_dataset(0)
+        except Exception as e: print(f"Tag Load Error: {e}")
         if ds:
             dialog = DicomTagWindow(ds, self)
             dialog.exec()
@@ -716,4 +958,21 @@ class ZetaViewport(QFrame):
         if event.mimeData().hasFormat("application/x-zeta-series-uid"):
             uid = event.mimeData().data("application/x-zeta-series-uid").data().decode('utf-8')
             self.series_dropped.emit(self, uid); event.accept(); self.set_active(True)
-        else: event.ignore()
\ No newline at end of file
+        else: event.ignore()
+
+
+def _sample_mpr(params, x0, y0, w, h, step=(1.0, 1.0), order=1, max_depth=None, slab_cache=None, pyramid=None):
+    """論理画像の画素座標 (x0, y0) を左上として w x h 画素を step 刻みでサンプリングする (描画スレッドからも呼ばれる)"""
+    center_point, vec_right, vec_down, vec_normal = params['geometry']
+    base_x = -params['image_size'][0] // 2; base_y = -params['image_size'][1] // 2
+    return get_resampled_slice(
+        params['volume'], center_point, vec_right, vec_down, vec_normal,
+        w, h, params['spacing'], params['thickness_mm'], params['mode'],
+        origin=(base_x + x0, base_y + y0), step=step, cval=params['cval'], order=order, max_depth=max_depth,
+        slab_cache=slab_cache, stats=params['stats'], pyramid=pyramid, grid=params['grid']
+    )
+
+def _to_qimage(img_u8):
+    # QImage は GUIスレッド以外で作ってよい (QPixmap への変換だけはGUIスレッドで行う)
+    h, w = img_u8.shape
+    return QImage(img_u8.data, w, h, w, QImage.Format.Format_Grayscale8).copy()
@@ -1,10 +1,13 @@
 import sys
-from PyQt6.QtWidgets import QApplication
-from gui.splash import ZetaSplashScreen
-from gui.main_window import ZetaViewer
 import time
 
 if __name__ == "__main__":
+    # フォルダスキャンのワーカープロセス (spawn) はこのファイルを import し直すので、
+    # Qt・GUI (と SimpleITK・scipy) の import はここに置き、ワーカーでは読み込まない
+    from PyQt6.QtWidgets import QApplication
+    from gui.splash import ZetaSplashScreen
+    from gui.main_window import ZetaViewer
+
     app = QApplication(sys.argv)
 
     # 1. スプラッシュ起動
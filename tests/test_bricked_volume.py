@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from scipy.ndimage import map_coordinates
+from core.bricked_volume import BrickedVolume, BrickWriter
+from core.mpr_logic import get_resampled_slice
+from core.volume_store import VolumeStore
+
+SHAPE = (37, 45, 52)   # ブリックの格子で割り切れない大きさ
+
+@pytest.fixture(scope='module')
+def volume():
+    z, y, x = np.ogrid[:SHAPE[0], :SHAPE[1], :SHAPE[2]]
+    body = 800 * np.cos(x / 9.0) * np.sin(y / 7.0) + 300 * np.sin(z / 5.0)
+    return (body + np.random.default_rng(1).integers(-20, 20, SHAPE)).astype(np.int16)
+
+def _write(path, volume, brick, chunk=5):
+    writer = BrickWriter(str(path), volume.shape, volume.dtype, brick=brick)
+    for z0 in range(0, volume.shape[0], chunk): writer.write(volume[z0:z0 + chunk])
+    writer.close()
+    return str(path)
+
+@pytest.fixture(params=[(9, None), (9, 0), (32, None)], ids=['brick9', 'brick9-evict', 'brick32'])
+def bricked(request, tmp_path, volume):
+    # cache_bytes=0 ではプールが最小 (8ブリック) になり、追い出しと点の分割が起きる
+    brick, cache_bytes = request.param
+    path = _write(tmp_path / 'vol.npy', volume, brick)
+    return BrickedVolume(path, volume.shape, volume.dtype, cache_bytes=cache_bytes)
+
+@pytest.mark.parametrize('key', [
+    np.s_[:], np.s_[3], np.s_[-1], np.s_[5:30, 7:44, 0:52], np.s_[:, 20], np.s_[10:11, :, 51], np.s_[8:8],
+])
+def test_getitem(bricked, volume, key):
+    np.testing.assert_array_equal(bricked[key], volume[key])
+
+def test_getitem_rejects_strided(bricked):
+    with pytest.raises(IndexError): bricked[::2]
+
+@pytest.mark.parametrize('order', [0, 1])
+def test_map_coordinates(bricked, volume, order):
+    rng = np.random.default_rng(2)
+    # 範囲外 (cval) と、ちょうど端・格子点の座標も含める
+    coords = np.array([rng.uniform(-2, n + 1, 4000) for n in SHAPE])
+    coords[:, :3] = np.array([[0, 0, 0], np.subtract(SHAPE, 1), [8, 16, 24]]).T
+    out = bricked.map_coordinates(coords, order=order, cval=-1024.0)
+    ref = map_coordinates(volume, coords, order=order, mode='constant', cval=-1024.0, output=np.float32)
+    np.testing.assert_allclose(out, ref, rtol=0, atol=1e-3)
+
+@pytest.mark.parametrize('thickness, mode', [(0, 'AVG'), (8, 'AVG'), (8, 'MIP'), (8, 'MinIP')])
+@pytest.mark.parametrize('oblique', [False, True])
+def test_resampled_slice_matches_ndarray(bricked, volume, thickness, mode, oblique):
+    if oblique:
+        a, b = 0.4, 0.25
+        r = np.array([np.cos(a), np.sin(a), 0.0])
+        d = np.array([-np.sin(a) * np.cos(b), np.cos(a) * np.cos(b), np.sin(b)])
+        vectors = (r, d, np.cross(r, d))
+    else:
+        vectors = (np.array([1.0, 0, 0]), np.array([0, 0, -1.0]), np.array([0, 1.0, 0]))
+    center = (25.3, 21.6, 18.45)
+    args = (center, *vectors, 72, 60, (1.0, 1.0, 1.0))
+    kwargs = dict(thickness_mm=thickness, mode=mode, cval=-1024.0, workers=2)
+    out = get_resampled_slice(bricked, *args, **kwargs)
+    ref = get_resampled_slice(volume, *args, **kwargs)
+    np.testing.assert_allclose(out, ref, rtol=0, atol=1e-2)
+
+def test_store_round_trip(tmp_path, volume):
+    src = tmp_path / 'IM00001.dcm'; src.write_bytes(b'\0' * 16)
+    root = tmp_path / 'volumes'; root.mkdir()
+    store = VolumeStore(root=str(root), limit_bytes=1 << 30)
+    writer = store.create_bricked('U1', [str(src)], volume.shape, volume.dtype)
+    writer.write(volume)
+    store.commit_bricked('U1', [str(src)], writer, (1.0, 0.7, 0.7))
+    vol, spacing, origin, stats, grid = store.load('U1', [str(src)])
+    assert isinstance(vol, BrickedVolume) and vol.shape == volume.shape and vol.dtype == volume.dtype
+    np.testing.assert_array_equal(vol[:], volume)
+    assert spacing == (1.0, 0.7, 0.7)
+
+def test_store_keeps_volume_larger_than_limit(tmp_path, volume):
+    # 上限より大きいブリック分割のボリュームも、書いた直後の prune で消さない (古いものは消す)
+    src = tmp_path / 'IM00001.dcm'; src.write_bytes(b'\0' * 16)
+    root = tmp_path / 'volumes'; root.mkdir()
+    store = VolumeStore(root=str(root), limit_bytes=100_000)
+    assert volume.nbytes > store.limit_bytes
+    store.save('OLD', [str(src)], np.zeros((4, 8, 8), dtype=np.int16), (1.0, 1.0, 1.0))
+    writer = store.create_bricked('U1', [str(src)], volume.shape, volume.dtype)
+    writer.write(volume)
+    assert store.commit_bricked('U1', [str(src)], writer, (1.0, 0.7, 0.7))
+    loaded = store.load('U1', [str(src)])
+    assert loaded is not None
+    np.testing.assert_array_equal(loaded[0][:], volume)
+    assert store.load('OLD', [str(src)]) is None
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from scipy.ndimage import map_coordinates
+from core.mpr_logic import get_resampled_slice, _sample_bounds
+from core.slab_cache import SlabCache
+
+# 最適化前の get_resampled_slice と同じ方法 (全サンプル点の座標を作って map_coordinates 1回) で切り出す
+def _reference(volume, center, vectors, width, height, offsets, mode='AVG', order=1):
+    xs = np.arange(-width // 2, width // 2); ys = np.arange(-height // 2, height // 2)
+    gx, gy = np.meshgrid(xs, ys)
+    zs = np.asarray(offsets, dtype=np.float64)[:, None, None]
+    x, y, z = (c + gx * r + gy * d + zs * n for c, r, d, n in zip(center, *vectors))
+    slab = map_coordinates(volume, np.array([z, y, x]), order=order, mode='constant',
+                           cval=float(np.min(volume)), output=np.float32)
+    if mode == 'MIP': return np.max(slab, axis=0)
+    if mode == 'MinIP': return np.min(slab, axis=0)
+    return np.mean(slab, axis=0)
+
+def _slab_offsets(thickness_mm, sp_x=1.0):
+    steps = int(thickness_mm / sp_x)
+    return np.arange(-steps // 2, steps // 2 + 1)
+
+@pytest.fixture(scope='module')
+def volume():
+    # なだらかな構造にノイズを乗せた int16 (float32 座標の誤差が大きく出ないように)
+    z, y, x = np.ogrid[:40, :48, :56]
+    body = 800 * np.cos(x / 9.0) * np.sin(y / 7.0) + 300 * np.sin(z / 5.0)
+    noise = np.random.default_rng(0).integers(-20, 20, (40, 48, 56))
+    return (body + noise).astype(np.int16)
+
+def _oblique(a=0.5, b=0.3):
+    r = np.array([np.cos(a), np.sin(a), 0.0])
+    d = np.array([-np.sin(a) * np.cos(b), np.cos(a) * np.cos(b), np.sin(b)])
+    return r, d, np.cross(r, d)
+
+AXIS_ALIGNED = {
+    'axial': ((1, 0, 0), (0, 1, 0), (0, 0, 1)),
+    'coronal': ((1, 0, 0), (0, 0, -1), (0, 1, 0)),
+    'sagittal': ((0, 1, 0), (0, 0, -1), (-1, 0, 0)),
+}
+
+@pytest.mark.parametrize('view', sorted(AXIS_ALIGNED))
+@pytest.mark.parametrize('center', [(28.0, 24.0, 20.0), (27.3, 23.6, 19.45), (50.5, 5.25, 38.0)])
+def test_axis_aligned_thin(volume, view, center):
+    vectors = tuple(np.array(v, dtype=np.float64) for v in AXIS_ALIGNED[view])
+    out = get_resampled_slice(volume, center, *vectors, 64, 48, (1.0, 1.0, 1.0))
+    np.testing.assert_array_equal(out, _reference(volume, center, vectors, 64, 48, [0.0]))
+
+@pytest.mark.parametrize('mode', ['AVG', 'MIP', 'MinIP'])
+def test_axis_aligned_slab(volume, mode):
+    vectors = tuple(np.array(v, dtype=np.float64) for v in AXIS_ALIGNED['coronal'])
+    center = (27.5, 23.25, 19.0)
+    out = get_resampled_slice(volume, center, *vectors, 64, 48, (1.0, 1.0, 1.0), thickness_mm=9, mode=mode)
+    np.testing.assert_array_equal(out, _reference(volume, center, vectors, 64, 48, _slab_offsets(9), mode))
+
+@pytest.mark.parametrize('workers', [1, 4])
+@pytest.mark.parametrize('order', [1, 3])
+def test_oblique_thin(volume, workers, order):
+    vectors = _oblique()
+    center = (27.3, 23.6, 19.45)
+    out = get_resampled_slice(volume, center, *vectors, 96, 80, (1.0, 1.0, 1.0), order=order, workers=workers)
+    np.testing.assert_array_equal(out, _reference(volume, center, vectors, 96, 80, [0.0], order=order))
+
+def test_cubic_sub_block(volume):
+    # 上のテストではサンプル範囲がボリューム全体に及ぶので、スプライン前処理の切り出しは全体と同じになる。
+    # 大きなボリュームの一部だけを切り出す場合は近似で、余白 8 ボクセルでの誤差は値の範囲の 0.27^8 (3e-5) 程度以下
+    rng = np.random.default_rng(5)
+    big = rng.integers(-1000, 1500, (96, 128, 128)).astype(np.int16)   # 白色雑音 (端の影響が最も大きい)
+    vectors = _oblique()
+    center = (64.3, 60.6, 47.45)
+    xs = np.arange(-12, 12); ys = np.arange(-10, 10)
+    lo, hi = _sample_bounds(big.shape, center, vectors, (xs, ys, np.zeros(1)), margin=8)
+    assert np.prod(np.subtract(hi, lo)) < 0.1 * big.size
+    out = get_resampled_slice(big, center, *vectors, 24, 20, (1.0, 1.0, 1.0), order=3, workers=1)
+    ref = _reference(big, center, vectors, 24, 20, [0.0], order=3)
+    np.testing.assert_allclose(out, ref, rtol=0, atol=3e-5 * np.ptp(big))
+
+@pytest.mark.parametrize('mode', ['AVG', 'MIP', 'MinIP'])
+def test_oblique_slab(volume, mode):
+    vectors = _oblique()
+    center = (27.3, 23.6, 19.45)
+    out = get_resampled_slice(volume, center, *vectors, 96, 80, (1.0, 1.0, 1.0), thickness_mm=12, mode=mode, workers=4)
+    ref = _reference(volume, center, vectors, 96, 80, _slab_offsets(12), mode)
+    # スラブの座標は float32 (ボクセル内の誤差 1e-4 程度)
+    np.testing.assert_allclose(out, ref, rtol=0, atol=1e-2)
+
+@pytest.mark.parametrize('mode', ['AVG', 'MIP', 'MinIP'])
+@pytest.mark.parametrize('page', [1.0, 0.5, 1.7])
+def test_slab_cache_matches_uncached(volume, mode, page):
+    # ページングの刻みが法線ベクトルの整数倍でなくても、キャッシュの有無で結果が変わらないこと
+    vectors = _oblique(0.3, 0.2)
+    cache = SlabCache()
+    start = np.array([27.3, 23.6, 12.45])
+    for k in list(range(10)) + list(range(8, -3, -1)):
+        center = tuple(start + k * page * vectors[2])
+        args = (volume, center, *vectors, 48, 40, (1.0, 1.0, 1.0))
+        cached = get_resampled_slice(*args, thickness_mm=10, mode=mode, slab_cache=cache, workers=1)
+        uncached = get_resampled_slice(*args, thickness_mm=10, mode=mode, workers=1)
+        np.testing.assert_array_equal(cached, uncached)
+
+def test_slab_cache_ignores_max_depth(volume):
+    # キャッシュから返すのは間引かない全層の投影
+    vectors = _oblique(0.3, 0.2)
+    cache = SlabCache()
+    full = None
+    for k in range(3):
+        center = tuple(np.array([27.3, 23.6, 15.0]) + k * vectors[2])
+        args = (volume, center, *vectors, 48, 40, (1.0, 1.0, 1.0))
+        out = get_resampled_slice(*args, thickness_mm=10, mode='MIP', slab_cache=cache, max_depth=3, workers=1)
+        full = get_resampled_slice(*args, thickness_mm=10, mode='MIP', workers=1)
+        if k > 0: np.testing.assert_array_equal(out, full)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from core.volume import VolumeStats, VolumeGrid
+from core.volume_store import VolumeStore
+
+@pytest.fixture
+def source_files(tmp_path):
+    paths = []
+    for i in range(3):
+        p = tmp_path / f"IM{i:05d}.dcm"; p.write_bytes(bytes(16 + i)); paths.append(str(p))
+    return paths
+
+@pytest.fixture
+def store(tmp_path):
+    root = tmp_path / 'volumes'; root.mkdir()
+    return VolumeStore(root=str(root), limit_bytes=1 << 30)
+
+@pytest.mark.parametrize('dtype', [np.int16, np.float32])
+def test_save_load_round_trip(store, source_files, dtype):
+    rng = np.random.default_rng(0)
+    volume = rng.integers(-1024, 2000, (6, 20, 24)).astype(dtype)
+    stats = VolumeStats.from_volume(volume)
+    grid = VolumeGrid((8, 30, 30), (2.0, 0.7, 0.7), offset=(1, 4, 3), direction=(1, 0, 0, 0, 0.8, -0.6, 0, 0.6, 0.8))
+    store.save('U1', source_files, volume, (2.0, 0.7, 0.7), origin=(-100.0, -120.0, 50.0), stats=stats, grid=grid)
+
+    vol, spacing, origin, loaded_stats, loaded_grid = store.load('U1', source_files)
+    assert isinstance(vol, np.memmap) and not vol.flags.writeable
+    assert vol.dtype == volume.dtype
+    np.testing.assert_array_equal(vol, volume)
+    assert spacing == (2.0, 0.7, 0.7)
+    assert origin == (-100.0, -120.0, 50.0)
+    assert loaded_stats.to_dict() == stats.to_dict()
+    assert loaded_grid.to_dict() == grid.to_dict()
+    np.testing.assert_allclose(loaded_grid.matrix, grid.matrix)
+
+def test_load_without_optional_header(store, source_files):
+    volume = np.arange(2 * 3 * 4, dtype=np.int16).reshape(2, 3, 4)
+    store.save('U1', source_files, volume, (1.0, 1.0, 1.0))
+    vol, spacing, origin, stats, grid = store.load('U1', source_files)
+    np.testing.assert_array_equal(vol, volume)
+    assert origin is None and stats is None and grid is None
+
+def test_changed_files_miss(store, source_files):
+    store.save('U1', source_files, np.zeros((2, 3, 4), dtype=np.int16), (1.0, 1.0, 1.0))
+    assert store.load('U2', source_files) is None
+    with open(source_files[1], 'ab') as f: f.write(b'\0')
+    assert store.load('U1', source_files) is None
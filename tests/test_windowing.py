@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from pydicom.dataset import Dataset
+from core.series import CompactSeries
+from core.windowing import apply_window, apply_window_raw, window_lut
+
+WINDOWS = [(40, 400), (-600, 1500), (300, 1), (0, 0), (37.5, 351.3), (2000, 80)]
+RESCALE = [(1.0, -1024.0), (1.0, 0.0), (0.5, -100.0), (2.3, 17.25), (-1.0, 0.0)]
+
+def _all_values(dtype):
+    info = np.iinfo(dtype)
+    return np.arange(info.min, info.max + 1, dtype=np.int64).astype(dtype)
+
+@pytest.mark.parametrize('level, width', WINDOWS)
+@pytest.mark.parametrize('slope, intercept', RESCALE)
+@pytest.mark.parametrize('dtype', [np.int16, np.uint16, np.uint8])
+def test_lut_matches_float_path(dtype, level, width, slope, intercept):
+    # 全ての格納値で、CT値に変換してからの apply_window と同じ 8bit 値になる
+    raw = _all_values(dtype)
+    out = apply_window_raw(raw, level, width, slope, intercept)
+    ref = apply_window(raw.astype(np.float32) * np.float32(slope) + np.float32(intercept), level, width)
+    assert out.dtype == np.uint8 and out.shape == raw.shape
+    np.testing.assert_array_equal(out, ref)
+
+def test_lut_is_cached_and_read_only():
+    lut = window_lut(40.0, 400.0, 1.0, -1024.0, True)
+    assert lut is window_lut(40.0, 400.0, 1.0, -1024.0, True)
+    assert lut.shape == (65536,) and not lut.flags.writeable
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64, np.int32])
+def test_other_dtypes_use_float_path(dtype):
+    raw = np.linspace(-2000, 3000, 64 * 48).reshape(64, 48).astype(dtype)
+    out = apply_window_raw(raw, 40, 400, 1.0, -1024.0)
+    np.testing.assert_array_equal(out, apply_window(raw.astype(np.float32) * np.float32(1.0) + np.float32(-1024.0), 40, 400))
+
+def test_non_contiguous_input():
+    raw = np.random.default_rng(0).integers(-1024, 3000, (64, 80)).astype(np.int16)
+    view = raw[::2, 5:70]
+    np.testing.assert_array_equal(apply_window_raw(view, 40, 400), apply_window_raw(np.ascontiguousarray(view), 40, 400))
+
+def test_series_window_slice_matches_hu_slice():
+    rng = np.random.default_rng(1)
+    pixels = rng.integers(-2000, 4000, (3, 32, 40)).astype(np.int16)
+    series = CompactSeries(pixels, ['a', 'b', 'c'], [1.0, 0.5, 2.0], [-1024.0, 0.0, 10.0], np.zeros((3, 3)), Dataset())
+    for i in range(3):
+        np.testing.assert_array_equal(series.window_slice(i, 40, 400), apply_window(series.get_hu_slice(i), 40, 400))
+        np.testing.assert_array_equal(series.get_hu_block(i, 5, 3, 30, 20), series.get_hu_slice(i)[3:20, 5:30])